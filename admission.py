@@ -0,0 +1,284 @@
+"""Admission control in front of the database.
+
+Every request is checked before its view runs:
+
+1. a token-bucket quota keyed on the caller (JWT identity, or client address
+   when anonymous) with rate and burst set per role; heavy endpoints cost
+   more tokens than ordinary ones. Login has its own, larger per-address
+   quota, since everyone behind one NAT or office proxy shares an address.
+   Behind a reverse proxy set TRUSTED_PROXIES so the address is the client's
+   rather than the proxy's;
+2. a concurrency limit for the request's lane. Heavy admin scans and exports,
+   other admin calls and the employee-facing endpoints each get their own
+   lane, so a burst of exports can't take the slots employee traffic needs.
+   Within a lane a single endpoint can be capped too (by default half the
+   heavy lane), so one kind of export can't hold every heavy slot.
+
+A request that fails either check gets an immediate 429 (quota) or 503 (lane
+full) with Retry-After instead of waiting for a database connection.
+
+Buckets and lanes live in each worker process. With WEB_CONCURRENCY workers
+the deployment as a whole admits up to that many times the configured
+concurrency, and a caller whose requests spread over every worker gets up to
+that many times its quota, so size both as per-worker shares.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+from flask import g, jsonify, request
+from flask_jwt_extended import decode_token
+
+from sqlalchemy import select
+
+from events import read_stream_token
+from models import db, User
+
+# Endpoints that scan whole tables or build exports
+HEAVY_ENDPOINTS = {
+    'admin.get_all_employees',
+    'admin.get_all_leave_requests',
+    'admin.get_all_attendance',
+    'admin.get_all_leave_balances',
+    'admin.get_changes',
+    'admin.export_employee_data_csv',
+    'admin.export_employee_data_pdf',
+    'admin.export_columnar',
+}
+
+# Anonymous endpoints metered on their own quota instead of 'anonymous'
+LOGIN_ENDPOINTS = {'auth.login'}
+
+# Long-lived streams hold no database connection, so they don't take a lane slot
+UNLIMITED_ENDPOINTS = {'events.stream_events', 'static'}
+
+# Per worker process, like the quotas below: the deployment allows WEB_CONCURRENCY times as many
+DEFAULT_CONCURRENCY = {'heavy': 4, 'admin': 16, 'employee': 64}
+
+# lane -> most slots one endpoint may hold in it; lanes not listed have no per-endpoint cap
+DEFAULT_ENDPOINT_CONCURRENCY = {'heavy': 2}
+
+# role -> (tokens per second, burst), per worker process
+DEFAULT_QUOTAS = {
+    'admin': (20, 60),
+    'manager': (10, 30),
+    'employee': (10, 30),
+    'anonymous': (5, 10),
+    'login': (20, 100),
+}
+
+HEAVY_COST = 10
+
+# Idle buckets are dropped once there are more than this many
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost):
+        """Spend `cost` tokens; returns 0 on success, otherwise seconds until it would succeed"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class Lane:
+    def __init__(self, name, limit, endpoint_limit=None):
+        self.name = name
+        self.limit = limit
+        self.endpoint_limit = endpoint_limit
+        self.in_flight = 0
+        self.by_endpoint = Counter()
+
+    def is_full(self, endpoint):
+        if self.in_flight >= self.limit:
+            return True
+        return self.endpoint_limit is not None and self.by_endpoint[endpoint] >= self.endpoint_limit
+
+
+class _Slot:
+    """A held lane slot; releasing twice is harmless"""
+
+    def __init__(self, controller, lane, endpoint):
+        self.controller = controller
+        self.lane = lane
+        self.endpoint = endpoint
+        self.released = False
+
+    def release(self):
+        self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.enabled = False
+        self.lanes = {}
+        self.quotas = dict(DEFAULT_QUOTAS)
+        self.heavy_cost = HEAVY_COST
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_ENABLED', True)
+        concurrency = dict(DEFAULT_CONCURRENCY, **app.config.get('ADMISSION_CONCURRENCY', {}))
+        endpoint_concurrency = dict(DEFAULT_ENDPOINT_CONCURRENCY, **app.config.get('ADMISSION_ENDPOINT_CONCURRENCY', {}))
+        self.lanes = {
+            name: Lane(name, limit, endpoint_concurrency.get(name))
+            for name, limit in concurrency.items()
+        }
+        self.quotas = dict(DEFAULT_QUOTAS, **app.config.get('ADMISSION_QUOTAS', {}))
+        self.heavy_cost = app.config.get('ADMISSION_HEAVY_COST', HEAVY_COST)
+        app.extensions['admission'] = self
+
+        if self.enabled:
+            app.before_request(self._admit)
+            app.after_request(self._release_on_close)
+            app.teardown_request(self._release_on_teardown)
+
+    @staticmethod
+    def lane_for(endpoint):
+        if endpoint in HEAVY_ENDPOINTS:
+            return 'heavy'
+        if endpoint.startswith('admin.'):
+            return 'admin'
+        return 'employee'
+
+    @staticmethod
+    def _caller(endpoint):
+        """(key, role) from the bearer token without enforcing it; views still do that"""
+        if endpoint in LOGIN_ENDPOINTS:
+            return f"login:{request.remote_addr}", 'login'
+        token = None
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            token = header[len('Bearer '):]
+        elif request.args.get('stream_token'):
+            claims = read_stream_token(request.args['stream_token'])
+            if claims:
+                return f"user:{claims[0]}", claims[1]
+        if token:
+            try:
+                claims = decode_token(token)
+            except Exception:
+                claims = None
+            if claims:
+                role = claims.get('role') or AdmissionController._role_of(claims['sub'])
+                return f"user:{claims['sub']}", role
+        return f"addr:{request.remote_addr}", 'anonymous'
+
+    @staticmethod
+    def _role_of(user_id):
+        """Role of a user whose token predates the role claim; 'anonymous' once they're gone"""
+        role = db.session.execute(select(User.role).where(User.id == user_id)).scalar()
+        return role or 'anonymous'
+
+    def _take(self, key, role, cost):
+        rate, burst = self.quotas.get(role, self.quotas['employee'])
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune()
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket.take(cost)
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[key]
+
+    def _admit(self):
+        endpoint = request.endpoint
+        if endpoint is None:
+            return None
+
+        key, role = self._caller(endpoint)
+        lane_name = self.lane_for(endpoint)
+        retry_after = self._take(key, role, self.heavy_cost if lane_name == 'heavy' else 1)
+        if retry_after:
+            self._count(f'rejected_quota.{role}')
+            return self._reject(429, "Request quota exceeded", retry_after)
+
+        if endpoint in UNLIMITED_ENDPOINTS:
+            self._count('admitted.unlimited')
+            return None
+
+        lane = self.lanes[lane_name]
+        with self._lock:
+            if lane.is_full(endpoint):
+                self.counters[f'rejected_busy.{lane_name}'] += 1
+                busy = True
+            else:
+                lane.in_flight += 1
+                lane.by_endpoint[endpoint] += 1
+                self.counters[f'admitted.{lane_name}'] += 1
+                busy = False
+        if busy:
+            return self._reject(503, "Server busy, try again shortly", 1)
+
+        g.admission_slot = _Slot(self, lane, endpoint)
+        return None
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @staticmethod
+    def _reject(status, message, retry_after):
+        response = jsonify({"error": message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _release(self, slot):
+        with self._lock:
+            if not slot.released:
+                slot.released = True
+                slot.lane.in_flight -= 1
+                slot.lane.by_endpoint[slot.endpoint] -= 1
+                if not slot.lane.by_endpoint[slot.endpoint]:
+                    del slot.lane.by_endpoint[slot.endpoint]
+
+    def _release_on_close(self, response):
+        # Streaming responses keep the slot until the body has been sent
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            response.call_on_close(slot.release)
+        return response
+
+    def _release_on_teardown(self, exc):
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            slot.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lanes": {
+                    name: {
+                        "limit": lane.limit,
+                        "endpoint_limit": lane.endpoint_limit,
+                        "in_flight": lane.in_flight,
+                        "by_endpoint": dict(lane.by_endpoint)
+                    }
+                    for name, lane in self.lanes.items()
+                },
+                "quotas": {role: {"rate": rate, "burst": burst} for role, (rate, burst) in self.quotas.items()},
+                "counters": dict(self.counters),
+                "tracked_callers": len(self._buckets)
+            }
+
+
+admission = AdmissionController()
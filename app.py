@@ -3,9 +3,16 @@ from flask import Flask
 from datetime import timedelta
 import os
 from models import db
-from routes import auth_bp, admin_bp, employee_bp, manager_bp
+from routes import auth_bp, admin_bp, employee_bp, manager_bp, events_bp
+from events import broker
+from replicas import router
+# Imported for its after_flush hook, which keeps the search index in step with every write
+import search
+import click
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.exc import SQLAlchemyError
 
 # Import the register_routes function
 # from routes import register_routes
@@ -16,6 +23,38 @@ def create_app():
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql://postgres:postgres123@db:5432/employee_management')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Optional read replicas, comma separated; GET endpoints read from them when healthy
+    app.config['SQLALCHEMY_REPLICA_URIS'] = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    # Create tables on boot (handy in development); set to 0 in production and run `flask init-db`
+    # once, and again after every upgrade: it also adds columns new models need to existing tables
+    app.config['AUTO_CREATE_SCHEMA'] = os.environ.get('AUTO_CREATE_SCHEMA', '1') == '1'
+    # Attendance partitioning (Postgres) and retention
+    app.config['ATTENDANCE_PARTITIONS_AHEAD'] = int(os.environ.get('ATTENDANCE_PARTITIONS_AHEAD', 3))
+    app.config['ATTENDANCE_RETENTION_YEARS'] = int(os.environ.get('ATTENDANCE_RETENTION_YEARS', 3))
+    # Admission control: per-lane concurrency limits and per-role request quotas, both per worker
+    app.config['ADMISSION_ENABLED'] = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+    app.config['ADMISSION_CONCURRENCY'] = {
+        'heavy': int(os.environ.get('ADMISSION_HEAVY_CONCURRENCY', 4)),
+        'admin': int(os.environ.get('ADMISSION_ADMIN_CONCURRENCY', 16)),
+        'employee': int(os.environ.get('ADMISSION_EMPLOYEE_CONCURRENCY', 64)),
+    }
+    # Most heavy slots one endpoint (e.g. one export type) may hold at once
+    app.config['ADMISSION_ENDPOINT_CONCURRENCY'] = {
+        'heavy': int(os.environ.get('ADMISSION_HEAVY_ENDPOINT_CONCURRENCY', 2)),
+    }
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto headers are trusted;
+    # quotas for anonymous callers are keyed on the client address, so set this behind a proxy
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # Single-node SQLite: funnel hot writes through one batching writer thread (WAL pragmas always apply)
+    app.config['SQLITE_WRITE_QUEUE'] = os.environ.get('SQLITE_WRITE_QUEUE', '1') == '1'
+    # Audit log: diffs are written in batches by a background thread; the spool directory
+    # keeps committed entries on disk until they are written so a crashed worker loses none
+    app.config['AUDIT_ENABLED'] = os.environ.get('AUDIT_ENABLED', '1') == '1'
+    app.config['AUDIT_FLUSH_INTERVAL'] = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1))
+    app.config['AUDIT_SPOOL_DIR'] = os.environ.get('AUDIT_SPOOL_DIR')
+    # Most entries held in memory while the database is unreachable (the spool, when set, keeps the rest)
+    app.config['AUDIT_MAX_PENDING'] = int(os.environ.get('AUDIT_MAX_PENDING', 100000))
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')  # Change in production
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # Session timeout after 30 minutes
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'your_jwt_secret_key')
@@ -23,17 +62,35 @@ def create_app():
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_BLACKLIST_ENABLED'] = True
     app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access', 'refresh']
+    # Shared file used to fan out server-sent events across workers (in-process only when unset)
+    app.config['EVENT_BROKER_PATH'] = os.environ.get('EVENT_BROKER_PATH')
+    app.config['EVENT_BROKER_MAX_BYTES'] = int(os.environ.get('EVENT_BROKER_MAX_BYTES', 10 * 1024 * 1024))
 
     # Configure secure cookies
     app.config['SESSION_COOKIE_SECURE'] = True  # Only send over HTTPS
     app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent JavaScript access
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF protection
 
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
+
     # Initialize extensions
     # login_manager = LoginManager()
     # login_manager.init_app(app)
     db.init_app(app)
+    # Subsystems a worker may not use are only imported when it does, to keep boots short
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        from sqlite_mode import init_sqlite_mode
+        init_sqlite_mode(app)
+    router.init_app(app)
+    if app.config['ADMISSION_ENABLED']:
+        from admission import admission
+        admission.init_app(app)
+    if app.config['AUDIT_ENABLED']:
+        from audit import audit_log
+        audit_log.init_app(app)
     jwt = JWTManager(app)
+    broker.init_app(app)
 
     blacklist = set()
 
@@ -42,9 +99,70 @@ def create_app():
         jti = jwt_payload['jti']
         return jti in blacklist
 
+    def init_schema():
+        from migrations import upgrade_schema, schema_lock
+        from partitions import ensure_attendance_partitions, needs_partitioning
+        from workdays import ensure_calendars
+        # Workers booting together would otherwise race each other through the DDL
+        with schema_lock(db.engine):
+            db.create_all()
+            upgrade_schema(db.session.connection())
+            search.ensure_search_index()
+            db.session.commit()
+            # A partition problem must not keep workers from booting: attendance still lands in the default partition
+            try:
+                ensure_attendance_partitions(db.session.connection(), app.config['ATTENDANCE_PARTITIONS_AHEAD'])
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                app.logger.exception("Could not create attendance partitions; retry with `flask attendance-partitions`")
+            if needs_partitioning(db.session.connection()):
+                app.logger.warning("attendance is a plain table; run `flask partition-attendance` to partition it by month")
+            ensure_calendars()
+
     # Create database tables
-    with app.app_context():
-        db.create_all()
+    if app.config['AUTO_CREATE_SCHEMA']:
+        with app.app_context():
+            init_schema()
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create or upgrade database tables and build the search index"""
+        init_schema()
+
+    # Run daily (e.g. from cron) so next months' partitions exist before they are needed
+    @app.cli.command('attendance-partitions')
+    def attendance_partitions_command():
+        """Create upcoming monthly attendance partitions"""
+        from partitions import ensure_attendance_partitions
+        names = ensure_attendance_partitions(db.session.connection(), app.config['ATTENDANCE_PARTITIONS_AHEAD'])
+        db.session.commit()
+        click.echo(f"Attendance partitions ready: {', '.join(names) or 'table is not partitioned'}")
+
+    # Run daily (e.g. from cron) so working-day calendars keep reaching CALENDAR_YEARS_AHEAD years out
+    @app.cli.command('extend-calendars')
+    def extend_calendars_command():
+        """Build missing working-day calendars and extend those about to run out"""
+        from workdays import ensure_calendars
+        extended = ensure_calendars()
+        click.echo(f"Calendars extended: {', '.join(extended) or 'none needed'}")
+
+    @app.cli.command('partition-attendance')
+    def partition_attendance_command():
+        """Convert an attendance table created before partitioning into monthly partitions"""
+        from partitions import partition_existing_attendance
+        copied = partition_existing_attendance(db.session.connection(), app.config['ATTENDANCE_PARTITIONS_AHEAD'])
+        db.session.commit()
+        click.echo(f"Partitioned attendance, {copied} rows copied" if copied else "attendance needs no conversion")
+
+    @app.cli.command('archive-attendance')
+    @click.option('--keep-years', type=int, default=None, help='Years of attendance to keep online')
+    def archive_attendance_command(keep_years):
+        """Move attendance older than the retention period into attendance_archive"""
+        from partitions import archive_attendance
+        keep_years = keep_years if keep_years is not None else app.config['ATTENDANCE_RETENTION_YEARS']
+        for month, row_count in archive_attendance(keep_years):
+            click.echo(f"Archived {row_count} rows for {month:%Y-%m}")
 
     # User loader function for Flask-Login
     # @login_manager.user_loader
@@ -57,6 +175,7 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(employee_bp)
     app.register_blueprint(manager_bp)
+    app.register_blueprint(events_bp)
 
     return app
 
@@ -0,0 +1,367 @@
+"""Audit log of changes to employees, profiles, departments, leave requests
+and holidays.
+
+Session events capture a before/after diff of every audited row as it is
+flushed. The diffs wait in ``session.info`` until the transaction commits
+(a rollback discards them) and are then handed to a background writer,
+which inserts them into ``audit_log`` in batches, so audited writes don't
+pay for an extra insert.
+
+Entries still in memory are lost if the worker dies, at most
+``AUDIT_FLUSH_INTERVAL`` seconds' worth. When ``AUDIT_SPOOL_DIR`` is set,
+committed entries are also appended to a per-process spool file first; spool
+files left behind by dead workers are replayed on startup (a crash between
+the insert and the spool cleanup can replay a batch twice). Spool files are
+named after the worker's pid and a token drawn when it first spools, so a
+restarted worker that gets a dead one's pid back replays that worker's files
+instead of mistaking them for its own.
+
+While the database is unreachable entries queue up, at most
+``AUDIT_MAX_PENDING`` of them in memory. Past that, without a spool the
+oldest entries are dropped (and counted in ``dropped``); with a spool the
+in-memory copy is let go and the next flush reads the entries back from the
+spool files instead.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import date, datetime, time
+
+from flask import has_request_context, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, User, EmployeeProfile, Department, LeaveRequest, Holiday, AuditLog
+
+AUDITED_MODELS = (User, EmployeeProfile, Department, LeaveRequest, Holiday)
+
+# Bookkeeping columns that change on every write
+IGNORED_FIELDS = {'updated_at', 'change_version', 'change_xid'}
+
+# Recorded as changed, without the values
+REDACTED_FIELDS = {'password_hash'}
+REDACTED = '[redacted]'
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_PENDING = 100000
+
+logger = logging.getLogger(__name__)
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def _diff(obj, action):
+    """{field: [before, after]} for the mapped columns of `obj`"""
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if key in IGNORED_FIELDS:
+            continue
+        if action == 'update':
+            history = state.attrs[key].history
+            if not history.has_changes():
+                continue
+            before = history.deleted[0] if history.deleted else None
+            after = history.added[0] if history.added else None
+            if before == after:
+                continue
+        elif action == 'create':
+            before, after = None, state.dict.get(key)
+            if after is None:
+                continue
+        else:
+            before, after = state.dict.get(key), None
+        if key in REDACTED_FIELDS:
+            before, after = (REDACTED if before is not None else None), (REDACTED if after is not None else None)
+        changes[key] = [_jsonable(before), _jsonable(after)]
+    return changes
+
+
+def current_context():
+    """Actor and endpoint of the current request, also used by writes run off the request thread"""
+    if not has_request_context():
+        return {}
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    return {
+        'actor_id': int(identity) if identity is not None else None,
+        'endpoint': request.endpoint
+    }
+
+
+@event.listens_for(Session, 'after_flush')
+def capture_changes(session, flush_context):
+    if not audit_log.enabled:
+        return
+
+    entries = []
+    for action, objects in (('create', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, AUDITED_MODELS):
+                continue
+            changes = _diff(obj, action)
+            if action == 'update' and not changes:
+                continue
+            entries.append({
+                'action': action,
+                'entity': obj.__tablename__,
+                'entity_id': obj.id,
+                'changes': json.dumps(changes, default=str)
+            })
+    if not entries:
+        return
+
+    context = session.info.get('audit_context') or current_context()
+    now = datetime.utcnow()
+    for entry in entries:
+        entry.update(created_at=now, actor_id=context.get('actor_id'), endpoint=context.get('endpoint'))
+    session.info.setdefault('audit_pending', []).extend(entries)
+
+
+@event.listens_for(Session, 'after_commit')
+def _hand_off(session):
+    entries = session.info.pop('audit_pending', None)
+    if entries:
+        audit_log.record(entries)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('audit_pending', None)
+
+
+class AuditWriter:
+    def __init__(self):
+        self.enabled = False
+        self.engine = None
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.spool_dir = None
+        self.max_pending = DEFAULT_MAX_PENDING
+        # Entries thrown away because the queue was full and there was no spool to fall back on
+        self.dropped = 0
+        self._shedding = False
+        self._pending = []
+        # True once _pending was let go because the spool holds the same entries
+        self._spilled = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Spool files whose entries are in _pending, oldest first
+        self._segments = []
+        self._segment = 0
+        # (pid, token) naming this process's spool files
+        self._spool_owner = None
+        self._thread = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('AUDIT_ENABLED', True)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.spool_dir = app.config.get('AUDIT_SPOOL_DIR')
+        self.max_pending = app.config.get('AUDIT_MAX_PENDING', DEFAULT_MAX_PENDING)
+        app.extensions['audit'] = self
+        if not self.enabled or self._thread is not None:
+            return
+
+        with app.app_context():
+            self.engine = db.engine
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self._flush_at_exit)
+
+    @property
+    def _spool_path(self):
+        if self._spool_owner is None or self._spool_owner[0] != os.getpid():
+            self._spool_owner = (os.getpid(), uuid.uuid4().hex[:12])
+        return os.path.join(self.spool_dir, 'audit-%d-%s.log' % self._spool_owner)
+
+    def record(self, entries):
+        with self._lock:
+            if self.spool_dir:
+                # One O_APPEND write per commit, like the event broker's spool
+                data = ''.join(json.dumps(entry, default=str) + '\n' for entry in entries).encode()
+                fd = os.open(self._spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            if not self._spilled:
+                self._pending.extend(entries)
+                if len(self._pending) > self.max_pending:
+                    self._shed()
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def _shed(self):
+        """Bring _pending back under max_pending; the caller holds the lock"""
+        if self.spool_dir:
+            self._pending = []
+            self._spilled = True
+            return
+        overflow = len(self._pending) - self.max_pending
+        del self._pending[:overflow]
+        if not self._shedding:
+            logger.warning("Audit queue is full; dropping the oldest entries until the database is back")
+            self._shedding = True
+        self.dropped += overflow
+
+    def _take(self):
+        """Pending entries, the spool segments holding them, and whether they were read back
+        from the spool; the caller holds the lock"""
+        if self.spool_dir and os.path.exists(self._spool_path):
+            self._segment += 1
+            segment = f'{self._spool_path}.{self._segment}'
+            os.replace(self._spool_path, segment)
+            self._segments.append(segment)
+        spilled, self._spilled = self._spilled, False
+        if spilled:
+            entries = [entry for segment in self._segments for entry in _read_spool(segment)]
+        else:
+            entries = self._pending
+        self._pending = []
+        segments, self._segments = self._segments, []
+        return entries, segments, spilled
+
+    def _insert(self, entries):
+        rows = []
+        for entry in entries:
+            row = dict(entry)
+            if isinstance(row['created_at'], str):
+                row['created_at'] = datetime.fromisoformat(row['created_at'])
+            rows.append(row)
+        with self.engine.begin() as connection:
+            for start in range(0, len(rows), self.batch_size):
+                connection.execute(AuditLog.__table__.insert(), rows[start:start + self.batch_size])
+
+    def flush(self):
+        """Write everything pending now; on failure the entries go back to the queue"""
+        with self._lock:
+            entries, segments, spilled = self._take()
+        try:
+            if entries:
+                self._insert(entries)
+        except Exception:
+            with self._lock:
+                self._segments[:0] = segments
+                if spilled:
+                    self._pending = []
+                    self._spilled = True
+                else:
+                    self._pending[:0] = entries
+                    if len(self._pending) > self.max_pending:
+                        self._shed()
+            raise
+        for segment in segments:
+            os.remove(segment)
+        return len(entries)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Could not write the audit log at exit: %s", getattr(e, 'orig', e))
+
+    def _run(self):
+        replayed = not self.spool_dir
+        failing = False
+        while True:
+            with self._lock:
+                if len(self._pending) < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+            try:
+                if not replayed:
+                    self.replay_spools()
+                    replayed = True
+                self.flush()
+            except Exception as e:
+                # Database down or table missing: keep the entries and retry, logging once per outage.
+                # Only the driver's message: the statement parameters would put the diffs in the log
+                if not failing:
+                    logger.error("Could not write the audit log, retrying every %.1fs: %s",
+                                 self.flush_interval, getattr(e, 'orig', e))
+                failing = True
+            else:
+                if failing:
+                    logger.warning("Audit log writes recovered (%d entries dropped since start)", self.dropped)
+                failing = False
+                self._shedding = False
+
+    def replay_spools(self):
+        """Insert entries from spool files of workers that are no longer running, including
+        earlier processes that had this one's pid"""
+        replayed = 0
+        for path in glob.glob(os.path.join(self.spool_dir, 'audit-*.log*')):
+            owner = os.path.basename(path).split('.')[0].split('-')[1:]
+            pid, token = int(owner[0]), owner[1] if len(owner) > 1 else None
+            if pid == os.getpid():
+                if self._spool_owner == (pid, token):
+                    continue
+            elif _pid_alive(pid):
+                continue
+            entries = _read_spool(path)
+            if entries:
+                self._insert(entries)
+            os.remove(path)
+            replayed += len(entries)
+        return replayed
+
+
+def _read_spool(path):
+    # A worker killed mid-write can leave a partial last line
+    with open(path) as spool:
+        return [json.loads(line) for line in spool if line.endswith('\n')]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+audit_log = AuditWriter()
+
+
+def query_audit_log(actor_id=None, entity=None, entity_id=None, since=None, until=None, limit=100, offset=0):
+    """Newest-first audit entries matching the filters, with the actor's emp_id"""
+    query = db.session.query(AuditLog, User.emp_id).outerjoin(User, User.id == AuditLog.actor_id)
+    if actor_id is not None:
+        query = query.filter(AuditLog.actor_id == actor_id)
+    if entity:
+        query = query.filter(AuditLog.entity == entity)
+    if entity_id is not None:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if since:
+        query = query.filter(AuditLog.created_at >= since)
+    if until:
+        query = query.filter(AuditLog.created_at < until)
+    rows = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).offset(offset).limit(limit).all()
+    return [{
+        "id": entry.id,
+        "created_at": entry.created_at.isoformat(),
+        "actor_id": entry.actor_id,
+        "actor_emp_id": actor_emp_id,
+        "action": entry.action,
+        "entity": entry.entity,
+        "entity_id": entry.entity_id,
+        "endpoint": entry.endpoint,
+        "changes": json.loads(entry.changes)
+    } for entry, actor_emp_id in rows]
@@ -0,0 +1,124 @@
+"""Mixed read/write concurrency benchmark for the single-node SQLite mode.
+
+Seeds a throwaway SQLite file, then hammers the employee endpoints from
+several threads: a share of requests submit leave requests (writes), the
+rest read leave requests and attendance. Reports throughput, latency and
+how many requests failed, including "database is locked" errors.
+
+    python benchmarks/sqlite_concurrency.py --threads 16 --seconds 10 --write-ratio 0.3
+    python benchmarks/sqlite_concurrency.py --no-queue    # writes straight through db.session
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(app, users):
+    from flask_jwt_extended import create_access_token
+    from models import db, User, EmployeeProfile, Department
+
+    with app.app_context():
+        department = Department(name='Benchmark')
+        db.session.add(department)
+        db.session.flush()
+        tokens = []
+        for i in range(users):
+            user = User(emp_id=f'B{i:05d}', email=f'bench{i}@example.com', role='employee', department_id=department.id)
+            user.set_password('benchmark')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(EmployeeProfile(user_id=user.id, full_name=f'Bench User {i}'))
+            tokens.append(create_access_token(identity=str(user.id), additional_claims={'role': 'employee'}))
+        db.session.commit()
+    return tokens
+
+
+def worker(client, tokens, deadline, write_ratio, results, lock):
+    statuses = Counter()
+    latencies = []
+    while time.monotonic() < deadline:
+        headers = {'Authorization': 'Bearer ' + random.choice(tokens)}
+        start = time.perf_counter()
+        if random.random() < write_ratio:
+            first = date.today() + timedelta(days=random.randint(1, 300))
+            response = client.post('/api/leave', headers=headers, json={
+                'start_date': first.isoformat(),
+                'end_date': (first + timedelta(days=1)).isoformat(),
+                'reason': 'benchmark'
+            })
+            kind = 'write'
+        else:
+            response = client.get(random.choice(('/api/leave', '/api/attendance')), headers=headers)
+            kind = 'read'
+        latencies.append(time.perf_counter() - start)
+        statuses[f'{kind}.{response.status_code}'] += 1
+        if response.status_code >= 500 and b'locked' in response.data:
+            statuses['database_locked'] += 1
+        response.close()
+
+    with lock:
+        results['statuses'].update(statuses)
+        results['latencies'].extend(latencies)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--no-queue', action='store_true', help='disable the single-writer queue')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['ADMISSION_ENABLED'] = '0'
+    os.environ['SQLITE_WRITE_QUEUE'] = '0' if args.no_queue else '1'
+    sys.path.insert(0, ROOT)
+    from app import create_app
+
+    app = create_app()
+    tokens = seed(app, args.users)
+
+    results = {'statuses': Counter(), 'latencies': []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=worker, args=(app.test_client(), tokens, deadline, args.write_ratio, results, lock))
+        for _ in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(results['latencies'])
+    statuses = results['statuses']
+    failed = sum(count for key, count in statuses.items() if key.split('.')[-1][0] in '45')
+    print(f"mode={'direct' if args.no_queue else 'write-queue'} threads={args.threads} write_ratio={args.write_ratio}")
+    print(f"requests={len(latencies)} throughput={len(latencies) / elapsed:.1f}/s failed={failed} "
+          f"database_locked={statuses['database_locked']}")
+    print(f"latency_ms p50={percentile(latencies, 0.5) * 1000:.1f} p95={percentile(latencies, 0.95) * 1000:.1f} "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f}")
+    for key in sorted(statuses):
+        if key != 'database_locked':
+            print(f"  {key}: {statuses[key]}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Cold-start benchmark for the web worker.
+
+Boots the app in fresh interpreters and fails (exit code 1) when the median
+import or create_app() time, or the app's overhead over its frameworks,
+exceeds its budget, or when a lazily loaded module sneaks back into the
+startup import graph (the export libraries always; the subsystems in
+LEAN_UNUSED_MODULES when a lean Postgres worker boots). Import times come
+from boots under ``python -X importtime``; startup is timed in separate
+plain boots, since the instrumentation itself adds a sixth or so. A single
+boot varies by a few hundred milliseconds on a busy machine, so each
+configuration is booted ``--runs`` times and the median is compared.
+
+Two configurations are measured:
+
+* lean: AUTO_CREATE_SCHEMA=0 against an in-memory database, what a
+  production worker does once ``flask init-db`` has been run;
+* default: AUTO_CREATE_SCHEMA=1 against a real database, what a worker does
+  out of the box. It uses DATABASE_URL when set, otherwise a throwaway SQLite
+  file. The first boot creates the schema and is reported but not budgeted;
+  the median covers restarts against the existing schema.
+
+Absolute times depend on the machine, so the app's own overhead is also
+measured: boots that only import the frameworks (FRAMEWORK_BOOT) alternate
+with app boots, and the difference of the medians is budgeted. It barely
+moves when the machine as a whole is slower or busier. ``--relative`` checks
+only the overheads and the lazy imports; tests/test_startup.py runs it that
+way, since a shared test run is too noisy for absolute budgets.
+
+The absolute budgets sit a little above the medians measured when they were
+set (about 700 ms lean, 770 ms default, 700 ms of imports; the app adds
+about 100 ms to the frameworks). Pass larger ones on a slower machine:
+
+    python benchmarks/startup.py --runs 7 --import-budget-ms 1000 \\
+        --startup-budget-ms 1000 --default-startup-budget-ms 1100
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported when an export is requested
+LAZY_MODULES = ('reportlab', 'pyarrow', 'exports')
+
+# Subsystems a lean worker (Postgres, no admission control or audit log) has no use for at boot
+LEAN_UNUSED_MODULES = ('admission', 'audit', 'sqlite_mode', 'partitions', 'workdays', 'migrations', 'changes')
+
+BOOT = (
+    "import time; start = time.perf_counter()\n"
+    "from app import create_app\n"
+    "create_app()\n"
+    "print('startup_ms=%.1f' % ((time.perf_counter() - start) * 1000))\n"
+)
+
+# Just the libraries every boot has to import: what is left of a boot is the app's own overhead
+FRAMEWORK_BOOT = (
+    "import time; start = time.perf_counter()\n"
+    "import flask, flask_sqlalchemy, flask_jwt_extended, flask_login\n"
+    "import sqlalchemy.orm, sqlalchemy.dialects.postgresql, sqlalchemy.dialects.sqlite\n"
+    "print('startup_ms=%.1f' % ((time.perf_counter() - start) * 1000))\n"
+)
+
+
+def run_boot(database_url, auto_create_schema, importtime=False, code=BOOT, **env_overrides):
+    """(startup_ms, imports) of one boot; imports is empty unless `importtime`"""
+    env = dict(os.environ, **env_overrides)
+    env['DATABASE_URL'] = database_url
+    env['AUTO_CREATE_SCHEMA'] = '1' if auto_create_schema else '0'
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        sys.exit(result.returncode)
+    imports = parse_importtime(result.stderr) if importtime else []
+    startup_ms = float(result.stdout.strip().rsplit('startup_ms=', 1)[1])
+    return startup_ms, imports
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative_us, module, depth)] from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(cumulative), name.strip(), depth))
+    return imports
+
+
+def import_ms(imports):
+    return sum(cumulative for cumulative, _, depth in imports if depth == 0) / 1000
+
+
+def loaded_modules(imports):
+    return {name.split('.')[0] for _, name, _ in imports}
+
+
+def measure(runs, database_url, auto_create_schema):
+    """Median import and startup time over `runs` boots of each kind, the app's overhead over
+    a framework-only boot, the imports of the median importtime boot and the sorted startup times.
+
+    Framework and app boots alternate, so a machine that slows down or speeds up midway
+    shifts both medians alike and leaves the overhead alone.
+    """
+    traced = sorted(
+        (import_ms(imports), imports)
+        for imports in (run_boot(database_url, auto_create_schema, importtime=True)[1] for _ in range(runs))
+    )
+    startups = []
+    frameworks = []
+    for _ in range(runs):
+        frameworks.append(run_boot(database_url, auto_create_schema, code=FRAMEWORK_BOOT)[0])
+        startups.append(run_boot(database_url, auto_create_schema)[0])
+    startups.sort()
+    startup_median = statistics.median(startups)
+    overhead = startup_median - statistics.median(frameworks)
+    import_median = statistics.median(total for total, _ in traced)
+    return import_median, startup_median, overhead, traced[len(traced) // 2][1], startups
+
+
+def lean_subsystem_imports():
+    """LEAN_UNUSED_MODULES a lean Postgres worker imports anyway. Booting doesn't connect,
+    so no server is needed."""
+    _, imports = run_boot(
+        'postgresql://startup@127.0.0.1:1/startup', False, importtime=True,
+        ADMISSION_ENABLED='0', AUDIT_ENABLED='0'
+    )
+    loaded = loaded_modules(imports)
+    return [module for module in LEAN_UNUSED_MODULES if module in loaded]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--import-budget-ms', type=float, default=800)
+    parser.add_argument('--startup-budget-ms', type=float, default=800)
+    parser.add_argument('--default-startup-budget-ms', type=float, default=900)
+    parser.add_argument('--overhead-budget-ms', type=float, default=150)
+    parser.add_argument('--default-overhead-budget-ms', type=float, default=250)
+    parser.add_argument('--relative', action='store_true',
+                        help='only check the overheads and lazy imports, not the absolute times')
+    args = parser.parse_args()
+
+    failures = []
+
+    lean_imports_ms, lean_startup_ms, lean_overhead_ms, imports, lean_runs = measure(args.runs, 'sqlite://', False)
+    print(f"lean boot ({args.runs} runs, AUTO_CREATE_SCHEMA=0, in-memory database)")
+    print(f"  imports: median {lean_imports_ms:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    print(f"  startup: median {lean_startup_ms:.1f} ms (budget {args.startup_budget_ms:.0f} ms), "
+          f"range {lean_runs[0]:.0f}-{lean_runs[-1]:.0f} ms")
+    print(f"  overhead over the framework imports: {lean_overhead_ms:.1f} ms (budget {args.overhead_budget_ms:.0f} ms)")
+    print("  slowest top-level imports:")
+    for cumulative, name, _ in sorted((i for i in imports if i[2] == 0), reverse=True)[:10]:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+    if not args.relative and lean_imports_ms > args.import_budget_ms:
+        failures.append(f"import time {lean_imports_ms:.1f} ms over budget")
+    if not args.relative and lean_startup_ms > args.startup_budget_ms:
+        failures.append(f"lean startup time {lean_startup_ms:.1f} ms over budget")
+    if lean_overhead_ms > args.overhead_budget_ms:
+        failures.append(f"lean startup overhead {lean_overhead_ms:.1f} ms over budget")
+    loaded = loaded_modules(imports)
+    for module in LAZY_MODULES:
+        if module in loaded:
+            failures.append(f"{module} is imported at startup")
+    for module in lean_subsystem_imports():
+        failures.append(f"{module} is imported by a lean Postgres worker")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(scratch, 'startup.db')
+        first_boot_ms, _ = run_boot(database_url, True)
+        default_imports_ms, default_startup_ms, default_overhead_ms, _, default_runs = measure(
+            args.runs, database_url, True
+        )
+    print(f"default boot ({args.runs} runs, AUTO_CREATE_SCHEMA=1, {database_url.split(':', 1)[0]} database)")
+    print(f"  first boot (creates the schema): {first_boot_ms:.1f} ms")
+    print(f"  imports: median {default_imports_ms:.1f} ms")
+    print(f"  startup: median {default_startup_ms:.1f} ms (budget {args.default_startup_budget_ms:.0f} ms), "
+          f"range {default_runs[0]:.0f}-{default_runs[-1]:.0f} ms")
+    print(f"  overhead over the framework imports: {default_overhead_ms:.1f} ms "
+          f"(budget {args.default_overhead_budget_ms:.0f} ms)")
+
+    if not args.relative and default_startup_ms > args.default_startup_budget_ms:
+        failures.append(f"default startup time {default_startup_ms:.1f} ms over budget")
+    if default_overhead_ms > args.default_overhead_budget_ms:
+        failures.append(f"default startup overhead {default_overhead_ms:.1f} ms over budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Incremental change feed over the change-tracked models.
+
+Clients keep the `next_token` from each page and pass it back as `since`;
+every page is bounded, so a sync costs as much as the churn since the last
+token rather than the size of the tables.
+
+Rows are ordered by (change_xid, change_version). On Postgres versions come
+from a sequence and can commit out of order, so the feed only serves rows
+written by transactions older than every transaction still running
+(``pg_snapshot_xmin``): anything that commits later has a larger xid and
+sorts after the token. A long-running write transaction therefore holds the
+feed back until it finishes. Elsewhere change_xid is 0 and the token is just
+the last version.
+"""
+from sqlalchemy import text, tuple_
+
+from models import db, User, EmployeeProfile, LeaveRequest, Attendance, Tombstone
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def _user_data(user):
+    return {
+        "id": user.id,
+        "emp_id": user.emp_id,
+        "email": user.email,
+        "role": user.role,
+        "department_id": user.department_id,
+        "manager_id": user.manager_id
+    }
+
+
+def _profile_data(profile):
+    return {
+        "id": profile.id,
+        "user_id": profile.user_id,
+        "full_name": profile.full_name,
+        "salary": profile.salary,
+        "contact_email": profile.contact_email,
+        "phone": profile.phone
+    }
+
+
+def _leave_data(leave):
+    return {
+        "id": leave.id,
+        "employee_id": leave.employee_id,
+        "start_date": leave.start_date.strftime('%Y-%m-%d'),
+        "end_date": leave.end_date.strftime('%Y-%m-%d'),
+        "reason": leave.reason,
+        "status": leave.status
+    }
+
+
+def _attendance_data(record):
+    return {
+        "id": record.id,
+        "user_id": record.user_id,
+        "date": record.date.strftime('%Y-%m-%d'),
+        "status": record.status,
+        "check_in_time": record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else None,
+        "check_out_time": record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else None
+    }
+
+
+FEED_MODELS = {
+    'user': (User, _user_data),
+    'employee_profile': (EmployeeProfile, _profile_data),
+    'leave_request': (LeaveRequest, _leave_data),
+    'attendance': (Attendance, _attendance_data),
+}
+
+
+def parse_token(token):
+    """(change_xid, change_version) from a token; raises ValueError when malformed"""
+    xid, _, version = token.rpartition('.')
+    position = (int(xid) if xid else 0, int(version))
+    if min(position) < 0:
+        raise ValueError(token)
+    return position
+
+
+def format_token(xid, version):
+    return f'{xid}.{version}' if xid else str(version)
+
+
+def _visible_below():
+    """Oldest transaction id still running on Postgres, None where writes are serialized"""
+    session = db.session
+    if session.get_bind().dialect.name != 'postgresql':
+        return None
+    return session.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+
+def changes_since(since, limit=DEFAULT_PAGE_SIZE):
+    """Return (changes, next_token, has_more) for everything after the `since` token"""
+    since_xid, since_version = parse_token(since)
+    xmin = _visible_below()
+
+    def after_token(model):
+        position = tuple_(model.change_xid, model.change_version)
+        conditions = [position > tuple_(since_xid, since_version)]
+        if xmin is not None:
+            conditions.append(model.change_xid < xmin)
+        return model.query.filter(*conditions).order_by(model.change_xid, model.change_version).limit(limit)
+
+    items = []
+    for entity, (model, serialize) in FEED_MODELS.items():
+        items.extend(
+            ((row.change_xid, row.change_version), entity, 'upsert', row.id, serialize(row))
+            for row in after_token(model)
+        )
+    items.extend(
+        ((t.change_xid, t.change_version), t.entity, 'delete', t.entity_id, None)
+        for t in after_token(Tombstone)
+    )
+
+    items.sort(key=lambda item: item[0])
+    page = items[:limit]
+    changes = [{
+        "version": position[1],
+        "entity": entity,
+        "op": op,
+        "id": entity_id,
+        "data": data
+    } for position, entity, op, entity_id, data in page]
+
+    next_token = format_token(*page[-1][0]) if page else since
+    return changes, next_token, len(items) > limit
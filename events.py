@@ -0,0 +1,270 @@
+"""Server-sent event fan-out.
+
+Each open `/api/events` connection subscribes a small queue to a set of
+channels (``user:<id>`` and ``role:<role>``). Routes publish to channels after
+their commit succeeds.
+
+With a single worker messages are delivered in-process. When
+``EVENT_BROKER_PATH`` is configured, publishers append to that file instead
+and every worker tails it, which lets several gunicorn workers on one host
+share events without running a separate broker. Once the file passes
+``EVENT_BROKER_MAX_BYTES`` the publisher that notices renames it to
+``<path>.<timestamp>`` and later appends start a fresh file; tailers see the
+rename, finish reading the old file, read any files rotated out since (when
+several rotations happen between two polls) and continue with the new one.
+Rotated files are deleted ROTATED_RETENTION seconds later.
+
+An open stream holds its worker for as long as the client is connected, so
+production runs gunicorn with gevent workers (see gunicorn.conf.py), where a
+stream costs a greenlet rather than a thread.
+
+EventSource can't send an Authorization header, and an access token in the
+URL would end up in access logs and browser history. Browsers therefore
+trade their access token for a stream token (``POST /api/events/token``): it
+is signed for this one purpose, can't be used as an access token, and only
+opens a stream within STREAM_TOKEN_MAX_AGE seconds of being issued.
+"""
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Messages buffered per connection before a slow client starts dropping them
+SUBSCRIBER_QUEUE_SIZE = 100
+
+DEFAULT_SPOOL_MAX_BYTES = 10 * 1024 * 1024
+
+# Seconds a tailer keeps reading a rotated file for publishers that opened it just before the rename
+ROTATION_GRACE = 0.5
+
+# Seconds rotated files are kept for tailers that fall behind
+ROTATED_RETENTION = 60
+
+# Seconds a stream token can be used to open /api/events; an open stream is not cut off
+STREAM_TOKEN_MAX_AGE = 60
+
+
+class EventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._spool_path = None
+        self._spool_max_bytes = DEFAULT_SPOOL_MAX_BYTES
+
+    def init_app(self, app):
+        self._spool_path = app.config.get('EVENT_BROKER_PATH')
+        self._spool_max_bytes = app.config.get('EVENT_BROKER_MAX_BYTES', DEFAULT_SPOOL_MAX_BYTES)
+        if self._spool_path:
+            open(self._spool_path, 'a').close()
+            thread = threading.Thread(target=self._tail_spool, name='event-broker', daemon=True)
+            thread.start()
+
+    def subscribe(self, channels):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(q)
+        return q
+
+    def unsubscribe(self, q, channels):
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].discard(q)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def publish(self, channels, event, data):
+        message = {"channels": list(channels), "event": event, "data": data}
+        if self._spool_path:
+            # A single O_APPEND write of one line keeps concurrent publishers from interleaving
+            line = (json.dumps(message) + '\n').encode()
+            fd = os.open(self._spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+                if os.fstat(fd).st_size > self._spool_max_bytes:
+                    self._rotate(fd)
+            finally:
+                os.close(fd)
+        else:
+            self._dispatch(message)
+
+    def _dispatch(self, message):
+        with self._lock:
+            targets = set()
+            for channel in message['channels']:
+                targets.update(self._subscribers.get(channel, ()))
+        for q in targets:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def _rotate(self, fd):
+        """Move the full spool aside; `fd` is the publisher's descriptor for it"""
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # Another publisher may have rotated while we waited for the lock
+            current = os.stat(self._spool_path)
+            if current.st_ino == os.fstat(fd).st_ino and current.st_size > self._spool_max_bytes:
+                os.replace(self._spool_path, f'{self._spool_path}.{time.time_ns()}')
+                self._prune_rotated()
+        except FileNotFoundError:
+            pass
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _rotated_files(self):
+        """[(generation, path)] of rotated spool files, oldest first"""
+        prefix = self._spool_path + '.'
+        files = []
+        for path in glob.glob(glob.escape(self._spool_path) + '.*'):
+            generation = path[len(prefix):]
+            if generation.isdigit():
+                files.append((int(generation), path))
+        return sorted(files)
+
+    def _prune_rotated(self):
+        cutoff = time.time_ns() - ROTATED_RETENTION * 10 ** 9
+        for generation, path in self._rotated_files():
+            if generation < cutoff:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _rotated_between(self, spool, live):
+        """Rotated files newer than `spool` and older than `live`, oldest first, opened from the start"""
+        first = os.fstat(spool.fileno()).st_ino
+        last = os.fstat(live.fileno()).st_ino
+        between = []
+        found = False
+        for _, path in self._rotated_files():
+            try:
+                inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                continue
+            if inode == last:
+                # `live` was rotated out as well; the next poll picks up from there
+                break
+            if found:
+                try:
+                    between.append(open(path, 'rb'))
+                except FileNotFoundError:
+                    continue
+            elif inode == first:
+                found = True
+        return between
+
+    def _rotated(self, spool):
+        try:
+            return os.stat(self._spool_path).st_ino != os.fstat(spool.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _read_lines(self, spool, pending):
+        """Dispatch every complete line available in `spool`; returns the unfinished tail"""
+        while True:
+            chunk = spool.readline()
+            if not chunk:
+                return pending
+            pending += chunk
+            if not pending.endswith(b'\n'):
+                continue
+            try:
+                self._dispatch(json.loads(pending))
+            except ValueError:
+                pass
+            pending = b''
+
+    def _tail_spool(self):
+        current = open(self._spool_path, 'rb')
+        current.seek(0, os.SEEK_END)
+        pending = b''
+        # Rotated files still read for a moment, for publishers that opened them just before the rename
+        draining = []
+        while True:
+            pending = self._read_lines(current, pending)
+            for rotated in list(draining):
+                spool, tail, deadline = rotated
+                rotated[1] = self._read_lines(spool, tail)
+                if time.monotonic() > deadline:
+                    spool.close()
+                    draining.remove(rotated)
+
+            if self._rotated(current):
+                # Finish what was appended before the rename, then any files rotated out after this one,
+                # in order. The live file is opened first so a rotation meanwhile can't slip between the two
+                try:
+                    live = open(self._spool_path, 'rb')
+                except FileNotFoundError:
+                    # Renamed, and nobody has appended since to create the next one
+                    time.sleep(0.05)
+                    continue
+                pending = self._read_lines(current, pending)
+                draining.append([current, pending, time.monotonic() + ROTATION_GRACE])
+                for spool in self._rotated_between(current, live):
+                    draining.append([spool, self._read_lines(spool, b''), time.monotonic() + ROTATION_GRACE])
+                current = live
+                pending = b''
+                continue
+            time.sleep(0.05)
+
+
+broker = EventBroker()
+
+
+def _stream_token_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='event-stream')
+
+
+def issue_stream_token(user):
+    """Short-lived token that opens the user's event stream and nothing else"""
+    return _stream_token_serializer().dumps({'sub': user.id, 'role': user.role})
+
+
+def read_stream_token(token):
+    """(user_id, role) from a stream token, or None when it is forged or expired"""
+    try:
+        claims = _stream_token_serializer().loads(token, max_age=STREAM_TOKEN_MAX_AGE)
+    except BadSignature:
+        return None
+    return claims['sub'], claims['role']
+
+
+def publish_leave_status(leave_request):
+    """Tell the employee their leave request moved to a new status"""
+    broker.publish([f'user:{leave_request.employee_id}'], 'leave_status', {
+        "id": leave_request.id,
+        "status": leave_request.status
+    })
+
+
+def publish_leave_pending(leave_request, channels):
+    """Tell approvers a leave request is waiting for them"""
+    broker.publish(channels, 'leave_pending', {
+        "id": leave_request.id,
+        "employee_id": leave_request.employee_id,
+        "start_date": leave_request.start_date.strftime('%Y-%m-%d'),
+        "end_date": leave_request.end_date.strftime('%Y-%m-%d'),
+        "status": leave_request.status
+    })
+
+
+def publish_attendance(attendance):
+    """Tell the employee their attendance was recorded"""
+    broker.publish([f'user:{attendance.user_id}'], 'attendance', {
+        "date": attendance.date.strftime('%Y-%m-%d'),
+        "status": attendance.status
+    })
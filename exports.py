@@ -0,0 +1,292 @@
+"""Employee data exports: per-employee CSV/PDF reports and columnar
+(Arrow / Parquet) extracts for analytics consumers.
+
+Routes import this module inside the handlers, and reportlab / pyarrow are
+imported inside the functions that need them, so a worker doesn't load the
+export stack until an export is actually requested.
+"""
+import csv
+from datetime import datetime
+from io import StringIO, BytesIO
+
+from sqlalchemy import select
+
+from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance, leave_working_days, count_weekdays
+from partitions import parse_date_range
+
+
+def generate_employee_csv(user):
+    output = StringIO()
+    writer = csv.writer(output)
+    profile = user.profile
+
+    writer.writerow(['Employee Details'])
+    writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
+    writer.writerow([
+        user.emp_id,
+        profile.full_name if profile else '',
+        user.email,
+        user.role,
+        user.department.name if user.department else '',
+        user.leave_balance(datetime.utcnow().year)
+    ])
+    writer.writerow([])
+
+    writer.writerow(['Attendance'])
+    writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
+    for record in user.attendance:
+        writer.writerow([
+            record.date.strftime('%Y-%m-%d'),
+            record.status,
+            record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
+            record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
+        ])
+    writer.writerow([])
+
+    writer.writerow(['Leave Requests'])
+    writer.writerow(['start_date', 'end_date', 'reason', 'status'])
+    for leave in user.leave_requests:
+        writer.writerow([
+            leave.start_date.strftime('%Y-%m-%d'),
+            leave.end_date.strftime('%Y-%m-%d'),
+            leave.reason,
+            leave.status
+        ])
+    return output.getvalue()
+
+
+def generate_employee_pdf(user):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    y = height - 40
+    profile = user.profile
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Employee Details")
+    y -= 20
+    p.setFont("Helvetica", 12)
+    p.drawString(40, y, f"ID: {user.emp_id}")
+    y -= 15
+    p.drawString(40, y, f"Name: {profile.full_name if profile else ''}")
+    y -= 15
+    p.drawString(40, y, f"Email: {user.email}")
+    y -= 15
+    p.drawString(40, y, f"Role: {user.role}")
+    y -= 15
+    p.drawString(40, y, f"Department: {user.department.name if user.department else ''}")
+    y -= 15
+    p.drawString(40, y, f"Leave Balance: {user.leave_balance(datetime.utcnow().year)}")
+    y -= 30
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Attendance")
+    y -= 20
+    p.setFont("Helvetica", 10)
+    for record in user.attendance:
+        p.drawString(40, y, f"{record.date.strftime('%Y-%m-%d')}, {record.status}, {record.check_in_time or ''}, {record.check_out_time or ''}")
+        y -= 12
+        if y < 60:
+            p.showPage()
+            y = height - 40
+
+    y -= 20
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(40, y, "Leave Requests")
+    y -= 20
+    p.setFont("Helvetica", 10)
+    for leave in user.leave_requests:
+        p.drawString(40, y, f"{leave.start_date.strftime('%Y-%m-%d')} to {leave.end_date.strftime('%Y-%m-%d')}, {leave.reason}, {leave.status}")
+        y -= 12
+        if y < 60:
+            p.showPage()
+            y = height - 40
+
+    p.save()
+    buffer.seek(0)
+    return buffer
+
+
+# Rows fetched from the database per chunk, and written as one record batch
+EXPORT_CHUNK_SIZE = 50000
+
+
+class _ChunkSink:
+    """Write-only file object that hands out whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def attendance_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('attendance_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('emp_id', pa.string()),
+        ('department', pa.string()),
+        ('date', pa.date32()),
+        ('status', pa.string()),
+        ('check_in_time', pa.time64('us')),
+        ('check_out_time', pa.time64('us')),
+    ])
+
+
+def leave_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('leave_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('emp_id', pa.string()),
+        ('full_name', pa.string()),
+        ('department', pa.string()),
+        ('start_date', pa.date32()),
+        ('end_date', pa.date32()),
+        ('working_days', pa.int32()),
+        ('status', pa.string()),
+        ('reason', pa.string()),
+        ('created_at', pa.timestamp('us')),
+    ])
+
+
+def attendance_query(start_date=None, end_date=None, department_id=None):
+    """Column-only select of attendance rows, optionally filtered by date range and department"""
+    stmt = (
+        select(
+            Attendance.id, Attendance.user_id, User.emp_id, Department.name,
+            Attendance.date, Attendance.status, Attendance.check_in_time, Attendance.check_out_time
+        )
+        .join(User, User.id == Attendance.user_id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .order_by(Attendance.id)
+    )
+    if start_date:
+        stmt = stmt.where(Attendance.date >= start_date)
+    if end_date:
+        stmt = stmt.where(Attendance.date <= end_date)
+    if department_id:
+        stmt = stmt.where(User.department_id == department_id)
+    return stmt
+
+
+def leave_query(start_date=None, end_date=None, department_id=None):
+    """Column-only select of leave requests overlapping the given date range"""
+    stmt = (
+        select(
+            LeaveRequest.id, LeaveRequest.employee_id, User.emp_id, EmployeeProfile.full_name,
+            Department.name, LeaveRequest.start_date, LeaveRequest.end_date, leave_working_days(),
+            LeaveRequest.status, LeaveRequest.reason, LeaveRequest.created_at
+        )
+        .join(User, User.id == LeaveRequest.employee_id)
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .order_by(LeaveRequest.id)
+    )
+    if start_date:
+        stmt = stmt.where(LeaveRequest.end_date >= start_date)
+    if end_date:
+        stmt = stmt.where(LeaveRequest.start_date <= end_date)
+    if department_id:
+        stmt = stmt.where(User.department_id == department_id)
+    return stmt
+
+
+def iter_record_batches(stmt, schema, chunk_size=EXPORT_CHUNK_SIZE):
+    """Run the select with a server-side cursor and yield one record batch per chunk of rows"""
+    import pyarrow as pa
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        if 'working_days' in schema.names:
+            rows = _fill_working_days(rows, schema)
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+def _fill_working_days(rows, schema):
+    """Count leaves outside the precomputed calendar Monday to Friday, as leave_balances_for does"""
+    days, start, end = (schema.get_field_index(name) for name in ('working_days', 'start_date', 'end_date'))
+    filled = []
+    for row in rows:
+        if row[days] is None:
+            row = list(row)
+            row[days] = count_weekdays(row[start], row[end])
+        filled.append(row)
+    return filled
+
+
+def stream_table(stmt, schema, fmt):
+    """Yield the encoded export (``parquet`` or ``arrow`` IPC stream) chunk by chunk"""
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    try:
+        for batch in iter_record_batches(stmt, schema):
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parse_export_filters(args):
+    """Read start_date / end_date / department_id from the query string; raises ValueError with
+    a message for the client when a value is malformed"""
+    try:
+        start_date, end_date = parse_date_range(args)
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+    department_id = args.get('department_id')
+    if department_id:
+        try:
+            department_id = int(department_id)
+        except ValueError:
+            raise ValueError("Invalid department_id")
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'department_id': department_id or None,
+    }
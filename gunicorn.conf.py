@@ -0,0 +1,29 @@
+"""Gunicorn settings for production.
+
+Workers are gevent-based: every request runs in a greenlet, so an open
+/api/events stream costs a few kilobytes instead of a thread or a whole sync
+worker, and one worker can hold thousands of them. Workers share events
+through the EVENT_BROKER_PATH spool file, so set it whenever WEB_CONCURRENCY
+is above 1.
+
+Workers are not preloaded, and each one builds its own app. Keep
+AUTO_CREATE_SCHEMA=0 (the image does) and run `flask init-db` before starting
+gunicorn, so the workers don't all run the schema setup at once.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gevent'
+# Concurrent connections (streams included) per worker
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 2000))
+# With async workers this only bounds how long a blocked worker may stop heartbeating,
+# not how long a stream may stay open
+timeout = 30
+keepalive = 75
+
+
+def post_fork(server, worker):
+    # Let psycopg2 yield to other greenlets while it waits on Postgres
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
@@ -0,0 +1,106 @@
+"""In-place upgrades for databases created by an older version of the app.
+
+``db.create_all()`` only creates missing tables, so columns and indexes added
+to existing models later are added here. Every step is additive and safe to
+re-run; it runs as part of ``flask init-db`` and the boot-time schema setup.
+New columns must be nullable or carry a ``server_default``.
+"""
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn
+
+from models import db, CHANGE_TRACKED_MODELS, Tombstone, allocate_change_versions
+
+BACKFILL_CHUNK_SIZE = 5000
+
+# Postgres advisory lock key held while one process sets up the schema
+SCHEMA_LOCK_KEY = 7262535
+
+
+def add_missing_columns(connection):
+    """ALTER TABLE ... ADD COLUMN for model columns the database doesn't have; returns their names"""
+    inspector = sa.inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(sa.text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+            added.append(f'{table.name}.{column.name}')
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    return added
+
+
+def _sync_version_sequence(connection):
+    # Versions handed out by the counter before the sequence existed must not be reused
+    if connection.dialect.name == 'postgresql':
+        connection.execute(sa.text(
+            "SELECT setval('change_version_seq', c.value) FROM change_counter c, change_version_seq s "
+            "WHERE c.id = 1 AND c.value > s.last_value"
+        ))
+
+
+def backfill_change_versions(connection):
+    """Give rows written before change tracking a position in the change feed; returns the row count"""
+    _sync_version_sequence(connection)
+    backfilled = 0
+    for table in [model.__table__ for model in CHANGE_TRACKED_MODELS] + [Tombstone.__table__]:
+        # Versions from the single-writer counter era are already in commit order
+        connection.execute(
+            table.update()
+            .where(table.c.change_xid.is_(None), table.c.change_version.is_not(None))
+            .values(change_xid=0)
+        )
+        update = (
+            table.update()
+            .where(table.c.id == sa.bindparam('row_id'))
+            .values(change_xid=sa.bindparam('xid'), change_version=sa.bindparam('version'))
+        )
+        while True:
+            ids = connection.execute(
+                sa.select(table.c.id)
+                .where(table.c.change_version.is_(None))
+                .order_by(table.c.id)
+                .limit(BACKFILL_CHUNK_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            xid, versions = allocate_change_versions(connection, len(ids))
+            connection.execute(update, [
+                {'row_id': row_id, 'xid': xid, 'version': version} for row_id, version in zip(ids, versions)
+            ])
+            backfilled += len(ids)
+    return backfilled
+
+
+def upgrade_schema(connection):
+    """Bring an existing database up to the current models; returns the columns that were added"""
+    added = add_missing_columns(connection)
+    backfill_change_versions(connection)
+    return added
+
+
+@contextmanager
+def schema_lock(engine):
+    """Let one process at a time create or upgrade the schema; the others wait, then find it done.
+    Postgres only: elsewhere the database's own write lock has to do."""
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect() as connection:
+        connection.execute(sa.text("SELECT pg_advisory_lock(:key)"), {'key': SCHEMA_LOCK_KEY})
+        # The lock belongs to the session, so don't keep a transaction (and its snapshot) open meanwhile
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.execute(sa.text("SELECT pg_advisory_unlock(:key)"), {'key': SCHEMA_LOCK_KEY})
+            connection.commit()
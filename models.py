@@ -1,12 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, date
+from sqlalchemy import event, update, DDL, case, func, select, text
+from sqlalchemy.orm import Session, aliased
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-#could add timestampMixin for automatic timestamping of created_at and updated_at fields
-class User(db.Model, UserMixin):
+
+class ChangeTrackingMixin:
+    """Adds updated_at and the (change_xid, change_version) position used by the change feed"""
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_version = db.Column(db.BigInteger, nullable=True)
+    # Postgres transaction id of the last write; 0 on databases that serialize writers
+    change_xid = db.Column(db.BigInteger, nullable=True)
+
+
+class User(ChangeTrackingMixin, db.Model, UserMixin):
     """User model for authentication and role management"""
     id = db.Column(db.Integer, primary_key=True)
     emp_id = db.Column(db.String(20), unique=True, nullable=False)
@@ -28,19 +39,13 @@ class User(db.Model, UserMixin):
 
     def leave_balance(self, year = None):
         """Calculate leave balance for the user"""
-        approved_leaves = LeaveRequest.query.filter_by(employee_id=self.id, status='approved').all()
-        days_taken = sum(
-            (lr.end_date - lr.start_date).days + 1
-            for lr in approved_leaves
-            if lr.start_date.year == year
-        )
-        return 20 - days_taken
+        return leave_balances_for([self.id], year)[self.id]
     
     def __repr__(self):
         return f'<User {self.emp_id}>'
 
 
-class EmployeeProfile(db.Model):
+class EmployeeProfile(ChangeTrackingMixin, db.Model):
     """Employee profile information"""
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
@@ -57,6 +62,8 @@ class Department(db.Model):
     """Department model"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
+    # Working-day calendar (region) used to count leave days
+    calendar = db.Column(db.String(50), nullable=False, default='default', server_default='default')
     
     # Relationships
     employees = db.relationship('User', backref='department', lazy=True)
@@ -65,7 +72,7 @@ class Department(db.Model):
         return f'<Department {self.name}>'
 
 
-class LeaveRequest(db.Model):
+class LeaveRequest(ChangeTrackingMixin, db.Model):
     """Leave request model"""
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -78,8 +85,12 @@ class LeaveRequest(db.Model):
     def __repr__(self):
         return f'<LeaveRequest {self.id} - {self.status}>'
     
-class Attendance(db.Model):
-    """Attendance model"""
+class Attendance(ChangeTrackingMixin, db.Model):
+    """Attendance model (range-partitioned by month on Postgres, see partitions.py)"""
+    __table_args__ = (
+        db.Index('ix_attendance_user_date', 'user_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -88,4 +99,287 @@ class Attendance(db.Model):
     check_out_time = db.Column(db.Time, nullable=True)
     
     def __repr__(self):
-        return f'<Attendance {self.user_id} - {self.date} - {self.status}>'
\ No newline at end of file
+        return f'<Attendance {self.user_id} - {self.date} - {self.status}>'
+
+
+class AttendanceArchive(db.Model):
+    """One month of attendance moved out by the retention policy, stored as gzipped NDJSON"""
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, index=True)
+    row_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AttendanceArchive {self.month:%Y-%m} - {self.row_count} rows>'
+
+
+class Holiday(db.Model):
+    """Public holiday in a working-day calendar"""
+    __table_args__ = (
+        db.UniqueConstraint('calendar', 'date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    calendar = db.Column(db.String(50), nullable=False, default='default')
+    date = db.Column(db.Date, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+
+    def __repr__(self):
+        return f'<Holiday {self.calendar} {self.date}>'
+
+
+class WorkingDay(db.Model):
+    """One row per calendar day with a running count of working days (rebuilt by workdays.py)"""
+    calendar = db.Column(db.String(50), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    is_working = db.Column(db.Boolean, nullable=False)
+    # Working days from the start of the calendar up to and including this date
+    cumulative = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<WorkingDay {self.calendar} {self.date}>'
+
+
+def _nocase(length):
+    # NOCASE lets SQLite answer short prefix LIKEs from the column indexes
+    return db.String(length).with_variant(db.String(length, collation='NOCASE'), 'sqlite')
+
+
+class EmployeeSearch(db.Model):
+    """Denormalised search document, one row per user (kept in sync by search.py)"""
+    __tablename__ = 'employee_search'
+
+    # No foreign key: the row is dropped in the same flush that deletes the user
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    emp_id = db.Column(_nocase(20), nullable=False, index=True)
+    email = db.Column(_nocase(120), nullable=False, index=True)
+    full_name = db.Column(_nocase(100), nullable=True, index=True)
+    department = db.Column(_nocase(100), nullable=True, index=True)
+    document = db.Column(db.Text, nullable=False)
+
+
+# Postgres searches `document` through a pg_trgm GIN index; SQLite through an
+# FTS5 trigram table that triggers keep in step with employee_search
+db.Index(
+    'ix_employee_search_document_trgm',
+    EmployeeSearch.document,
+    postgresql_using='gin',
+    postgresql_ops={'document': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
+
+event.listen(
+    EmployeeSearch.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+for statement in (
+    "CREATE VIRTUAL TABLE employee_search_fts USING fts5("
+    "full_name, emp_id, email, department, "
+    "content='employee_search', content_rowid='user_id', tokenize='trigram')",
+    "CREATE TRIGGER employee_search_ai AFTER INSERT ON employee_search BEGIN "
+    "INSERT INTO employee_search_fts(rowid, full_name, emp_id, email, department) "
+    "VALUES (new.user_id, new.full_name, new.emp_id, new.email, new.department); END",
+    "CREATE TRIGGER employee_search_ad AFTER DELETE ON employee_search BEGIN "
+    "INSERT INTO employee_search_fts(employee_search_fts, rowid, full_name, emp_id, email, department) "
+    "VALUES ('delete', old.user_id, old.full_name, old.emp_id, old.email, old.department); END",
+):
+    event.listen(EmployeeSearch.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+DEFAULT_CALENDAR = 'default'
+ANNUAL_LEAVE_DAYS = 20
+
+
+def working_days_between(start_date, end_date, calendar):
+    """SQL expression for the working days in [start_date, end_date]: two primary-key lookups
+    into the prefix sums. NULL when the dates fall outside the precomputed calendar."""
+    start_day = aliased(WorkingDay)
+    end_day = aliased(WorkingDay)
+    return (
+        select(end_day.cumulative - start_day.cumulative + case((start_day.is_working, 1), else_=0))
+        .where(
+            start_day.calendar == calendar,
+            start_day.date == start_date,
+            end_day.calendar == calendar,
+            end_day.date == end_date
+        )
+        .scalar_subquery()
+    )
+
+
+def leave_working_days():
+    """Working days of each LeaveRequest row, for queries joining LeaveRequest -> User -> Department"""
+    return working_days_between(
+        LeaveRequest.start_date, LeaveRequest.end_date,
+        func.coalesce(Department.calendar, DEFAULT_CALENDAR)
+    )
+
+
+def count_weekdays(start_date, end_date):
+    """Fallback for dates outside the precomputed calendar: Monday to Friday, no holidays"""
+    days = (end_date - start_date).days + 1
+    full_weeks, remainder = divmod(days, 7)
+    return full_weeks * 5 + sum(1 for offset in range(remainder) if (start_date.weekday() + offset) % 7 < 5)
+
+
+def leave_balances_for(user_ids, year):
+    """Leave balance for each of the given users, counting working days only.
+
+    One grouped query sums the working days of approved leaves starting in
+    `year`; leaves outside the precomputed calendar are counted in Python.
+    """
+    balances = {user_id: ANNUAL_LEAVE_DAYS for user_id in user_ids}
+    if not balances or year is None:
+        return balances
+
+    working_days = leave_working_days()
+    in_year = (
+        LeaveRequest.employee_id.in_(balances),
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date >= date(year, 1, 1),
+        LeaveRequest.start_date < date(year + 1, 1, 1)
+    )
+    totals = db.session.execute(
+        select(
+            LeaveRequest.employee_id,
+            func.sum(working_days),
+            func.count() - func.count(working_days)
+        )
+        .join(User, User.id == LeaveRequest.employee_id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .where(*in_year)
+        .group_by(LeaveRequest.employee_id)
+    )
+    uncovered = []
+    for employee_id, days_taken, missing in totals:
+        balances[employee_id] -= days_taken or 0
+        if missing:
+            uncovered.append(employee_id)
+
+    if uncovered:
+        leaves = db.session.execute(
+            select(LeaveRequest.employee_id, LeaveRequest.start_date, LeaveRequest.end_date)
+            .join(User, User.id == LeaveRequest.employee_id)
+            .outerjoin(Department, Department.id == User.department_id)
+            .where(*in_year, LeaveRequest.employee_id.in_(uncovered), working_days.is_(None))
+        )
+        for employee_id, start_date, end_date in leaves:
+            balances[employee_id] -= count_weekdays(start_date, end_date)
+    return balances
+
+
+class Tombstone(db.Model):
+    """Marker left behind when a change-tracked row is deleted"""
+    __table_args__ = (
+        db.Index('ix_tombstone_change_feed', 'change_xid', 'change_version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False)
+    change_xid = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Tombstone {self.entity} {self.entity_id}>'
+
+
+class AuditLog(db.Model):
+    """Before/after diff of one audited row, written in batches by audit.py"""
+    __table_args__ = (
+        db.Index('ix_audit_log_actor_created', 'actor_id', 'created_at'),
+        db.Index('ix_audit_log_entity_created', 'entity', 'entity_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    action = db.Column(db.String(10), nullable=False)  # 'create', 'update', 'delete'
+    entity = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=True)
+    endpoint = db.Column(db.String(100), nullable=True)
+    # JSON object of field -> [before, after]
+    changes = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<AuditLog {self.action} {self.entity} {self.entity_id}>'
+
+
+CHANGE_TRACKED_MODELS = (User, EmployeeProfile, LeaveRequest, Attendance)
+
+for _model in CHANGE_TRACKED_MODELS:
+    db.Index(f'ix_{_model.__tablename__}_change_feed', _model.change_xid, _model.change_version)
+
+
+class ChangeCounter(db.Model):
+    """Single-row counter that hands out change versions on databases without sequences"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+event.listen(
+    ChangeCounter.__table__,
+    'after_create',
+    DDL('INSERT INTO change_counter (id, value) VALUES (1, 0)')
+)
+
+# Postgres hands out versions from a sequence, so concurrent writers never wait on each other
+change_version_seq = db.Sequence('change_version_seq', metadata=db.metadata)
+
+
+def allocate_change_versions(connection, count):
+    """Reserve `count` versions; returns (change_xid, [versions]).
+
+    On Postgres versions come from a sequence and may commit out of order;
+    the change feed only serves rows whose transaction id is below the
+    oldest transaction still running (see changes.py), so a late commit is
+    never skipped. Elsewhere writers are serialized by the database, and the
+    counter row stays locked until commit, so versions are visible in commit
+    order and change_xid is always 0.
+    """
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(
+            text(
+                "SELECT pg_current_xact_id()::text::bigint, nextval('change_version_seq') "
+                "FROM generate_series(1, :count)"
+            ),
+            {'count': count}
+        ).all()
+        return rows[0][0], [version for _, version in rows]
+
+    table = ChangeCounter.__table__
+    last = connection.execute(
+        update(table)
+        .where(table.c.id == 1)
+        .values(value=table.c.value + count)
+        .returning(table.c.value)
+    ).scalar()
+    if last is None:
+        connection.execute(table.insert().values(id=1, value=count))
+        last = count
+    return 0, list(range(last - count + 1, last + 1))
+
+
+@event.listens_for(Session, 'before_flush')
+def assign_change_versions(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, ChangeTrackingMixin)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, ChangeTrackingMixin) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, ChangeTrackingMixin)]
+    if not changed and not deleted:
+        return
+
+    xid, versions = allocate_change_versions(session.connection(), len(changed) + len(deleted))
+    versions = iter(versions)
+    for obj in changed:
+        obj.change_xid = xid
+        obj.change_version = next(versions)
+    for obj in deleted:
+        session.add(Tombstone(
+            entity=obj.__tablename__, entity_id=obj.id, change_xid=xid, change_version=next(versions)
+        ))
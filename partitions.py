@@ -0,0 +1,236 @@
+"""Monthly range partitioning and retention for attendance.
+
+On Postgres the attendance table is created as ``PARTITION BY RANGE (date)``
+with one child table per month (``attendance_y2025m01``...) plus a default
+partition that catches rows outside the pre-created range. Queries that
+filter on ``Attendance.date`` only touch the matching months.
+
+Rows that landed in the default partition are moved into a month's table
+when that month's partition is created later. Partitioning only applies to
+tables created by this version: an existing plain ``attendance`` table is left
+as it is (and a warning is logged at boot) until ``flask partition-attendance``
+converts it.
+
+The retention policy moves whole months older than N years into
+``attendance_archive`` as gzipped NDJSON, then drops the month's partition,
+or deletes its rows on databases without partitioning. Archival is
+housekeeping, not a user delete, so it leaves no change-feed tombstones.
+"""
+import gzip
+import json
+from datetime import date, datetime
+from io import BytesIO
+
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+
+from models import db, Attendance, AttendanceArchive
+
+ARCHIVE_CHUNK_SIZE = 10000
+
+
+def _partitioned_attendance_table():
+    """Postgres DDL for attendance: the partition key has to be part of the primary key"""
+    source = Attendance.__table__
+    columns = [
+        sa.Column(column.name, column.type, nullable=column.nullable, autoincrement=column.name == 'id')
+        for column in source.columns
+    ]
+    foreign_keys = [
+        sa.ForeignKeyConstraint([column.name for column in fk.columns], [element.column for element in fk.elements])
+        for fk in source.foreign_key_constraints
+    ]
+    return sa.Table(
+        source.name, sa.MetaData(), *columns, *foreign_keys,
+        sa.PrimaryKeyConstraint('id', 'date'),
+        postgresql_partition_by='RANGE (date)'
+    )
+
+
+@compiles(CreateTable, 'postgresql')
+def _create_table(create, compiler, **kw):
+    if create.element is Attendance.__table__:
+        create = CreateTable(_partitioned_attendance_table())
+    return compiler.visit_create_table(create, **kw)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def partition_name(month):
+    return f'attendance_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'attendance'"
+    )).first() is not None
+
+
+def _create_month_partition(connection, month):
+    """Create one month's partition, first moving that month's rows out of the default partition"""
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    if connection.execute(sa.text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None:
+        return name
+
+    default_exists = connection.execute(sa.text("SELECT to_regclass('attendance_default')")).scalar() is not None
+    if default_exists:
+        # Postgres refuses a partition whose range has rows in the default partition, so move them
+        # into the new table before attaching it. The lock keeps new rows out of the default meanwhile.
+        connection.execute(sa.text("LOCK TABLE attendance_default IN EXCLUSIVE MODE"))
+        if connection.execute(sa.text("SELECT to_regclass(:name)"), {'name': name}).scalar() is not None:
+            return name
+        stray = connection.execute(sa.text(
+            "SELECT 1 FROM attendance_default WHERE date >= :start AND date < :end LIMIT 1"
+        ), {'start': month, 'end': add_months(month, 1)}).first()
+        if stray is not None:
+            columns = ', '.join(column.name for column in Attendance.__table__.columns)
+            connection.execute(sa.text(f"CREATE TABLE {name} (LIKE attendance INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            connection.execute(sa.text(
+                f"WITH moved AS (DELETE FROM attendance_default WHERE date >= :start AND date < :end RETURNING {columns}) "
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+            ), {'start': month, 'end': add_months(month, 1)})
+            connection.execute(sa.text(f"ALTER TABLE attendance ATTACH PARTITION {name} FOR VALUES {bounds}"))
+            return name
+
+    connection.execute(sa.text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF attendance FOR VALUES {bounds}"))
+    return name
+
+
+def ensure_attendance_partitions(connection, months_ahead=3, today=None, since=None):
+    """Create partitions from last month (or the month of `since`) through `months_ahead` months out;
+    returns their names"""
+    if not is_partitioned(connection):
+        return []
+
+    current = month_start(today or date.today())
+    month = min(month_start(since), add_months(current, -1)) if since else add_months(current, -1)
+    names = []
+    while month <= add_months(current, months_ahead):
+        names.append(_create_month_partition(connection, month))
+        month = add_months(month, 1)
+    connection.execute(sa.text("CREATE TABLE IF NOT EXISTS attendance_default PARTITION OF attendance DEFAULT"))
+    return names
+
+
+def needs_partitioning(connection):
+    """True for a plain attendance table on Postgres, left over from before partitioning"""
+    return (
+        connection.dialect.name == 'postgresql'
+        and sa.inspect(connection).has_table('attendance')
+        and not is_partitioned(connection)
+    )
+
+
+def partition_existing_attendance(connection, months_ahead=3):
+    """Convert a plain attendance table into the partitioned layout; returns the rows copied.
+
+    Runs in the caller's transaction and holds an exclusive lock on attendance for the copy,
+    so schedule it in a maintenance window on large tables."""
+    if not needs_partitioning(connection):
+        return 0
+
+    connection.execute(sa.text("LOCK TABLE attendance IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(sa.text("ALTER TABLE attendance RENAME TO attendance_unpartitioned"))
+    # Index names are schema-wide, so move the old ones out of the way of the new table's
+    index_names = connection.execute(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'attendance_unpartitioned'"
+    )).scalars().all()
+    for index_name in index_names:
+        connection.execute(sa.text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_unpartitioned"'))
+
+    Attendance.__table__.create(connection)
+    oldest = connection.execute(sa.text("SELECT min(date) FROM attendance_unpartitioned")).scalar()
+    ensure_attendance_partitions(connection, months_ahead, since=oldest)
+
+    columns = ', '.join(column.name for column in Attendance.__table__.columns)
+    copied = connection.execute(sa.text(
+        f"INSERT INTO attendance ({columns}) SELECT {columns} FROM attendance_unpartitioned"
+    )).rowcount
+    connection.execute(sa.text(
+        "SELECT setval(pg_get_serial_sequence('attendance', 'id'), COALESCE(max(id), 0) + 1, false) FROM attendance"
+    ))
+    connection.execute(sa.text("DROP TABLE attendance_unpartitioned"))
+    return copied
+
+
+def _archive_month(month, next_month):
+    """Copy one month of attendance into a compressed archive row; returns the row count"""
+    table = Attendance.__table__
+    rows = db.session.execute(
+        sa.select(table)
+        .where(table.c.date >= month, table.c.date < next_month)
+        .order_by(table.c.id)
+        .execution_options(yield_per=ARCHIVE_CHUNK_SIZE)
+    ).mappings()
+
+    buffer = BytesIO()
+    row_count = 0
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as archive:
+        for row in rows:
+            archive.write((json.dumps(dict(row), default=str) + '\n').encode())
+            row_count += 1
+
+    if row_count:
+        db.session.add(AttendanceArchive(month=month, row_count=row_count, payload=buffer.getvalue()))
+    return row_count
+
+
+def archive_attendance(keep_years, today=None):
+    """Move every whole month older than `keep_years` out of attendance; returns [(month, rows)]"""
+    cutoff = month_start(today or date.today())
+    cutoff = cutoff.replace(year=cutoff.year - keep_years)
+
+    oldest = db.session.query(sa.func.min(Attendance.date)).filter(Attendance.date < cutoff).scalar()
+    if oldest is None:
+        return []
+
+    connection = db.session.connection()
+    partitioned = is_partitioned(connection)
+    archived = []
+    month = month_start(oldest)
+    while month < cutoff:
+        next_month = add_months(month, 1)
+        row_count = _archive_month(month, next_month)
+        if partitioned:
+            connection.execute(sa.text(f"DROP TABLE IF EXISTS {partition_name(month)}"))
+        # Whatever is left for the month lives in the default partition (or the plain table)
+        db.session.execute(
+            Attendance.__table__.delete()
+            .where(Attendance.date >= month, Attendance.date < next_month)
+        )
+        db.session.commit()
+        if row_count:
+            archived.append((month, row_count))
+        month = next_month
+    return archived
+
+
+def parse_date_range(args):
+    """(start_date, end_date) from the query string; raises ValueError on a malformed date"""
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    return (
+        datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+        datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+    )
+
+
+def filter_attendance_dates(query, start_date, end_date):
+    """Restrict an attendance query to the date range so Postgres can prune partitions"""
+    if start_date:
+        query = query.filter(Attendance.date >= start_date)
+    if end_date:
+        query = query.filter(Attendance.date <= end_date)
+    return query
@@ -0,0 +1,187 @@
+"""Read-replica routing for db.session.
+
+Requests that opt in with `use_replica()` (the GET handlers of the admin and
+employee blueprints) read from a replica picked round-robin among the healthy
+ones. Everything else stays on the primary:
+
+* flushes, and so every write, always go to the primary;
+* an identity that committed a write is pinned to the primary for
+  REPLICA_STICKY_SECONDS so it reads its own writes. The pin is kept in this
+  process and also sent back as a short-lived signed cookie, so a follow-up
+  read that lands on another worker honours it too. Clients that drop cookies
+  only get read-your-writes from the worker that took the write;
+* a background check drops replicas that fail to answer or lag by more than
+  REPLICA_MAX_LAG_SECONDS, and with none left reads fall back to the primary.
+
+Replicas are listed in SQLALCHEMY_REPLICA_URIS; with none configured the
+router is a no-op.
+"""
+import itertools
+import threading
+import time
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, TimestampSigner
+from sqlalchemy import event
+
+PIN_COOKIE = 'db_pin'
+
+PG_LAG_QUERY = sa.text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = True
+        self.lag = 0.0
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == 'postgresql':
+                    self.lag = float(connection.execute(PG_LAG_QUERY).scalar() or 0)
+                else:
+                    connection.execute(sa.text('SELECT 1'))
+                    self.lag = 0.0
+            self.healthy = True
+        except sa.exc.SQLAlchemyError:
+            self.healthy = False
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = []
+        self.max_lag = 5.0
+        self.sticky_seconds = 5.0
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def init_app(self, app):
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [Replica(sa.create_engine(uri, **options)) for uri in uris]
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0)
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5.0)
+        app.extensions['replica_router'] = self
+
+        if self.replicas:
+            app.after_request(self._send_pin)
+            interval = app.config.get('REPLICA_HEALTH_INTERVAL', 2.0)
+            thread = threading.Thread(target=self._health_loop, args=(interval,), name='replica-health', daemon=True)
+            thread.start()
+
+    def _health_loop(self, interval):
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(interval)
+
+    def choose(self):
+        """Next usable replica engine, or None to fall back to the primary"""
+        usable = [r for r in self.replicas if r.healthy and r.lag <= self.max_lag]
+        if not usable:
+            return None
+        return usable[next(self._counter) % len(usable)].engine
+
+    def pin(self, identity):
+        now = time.monotonic()
+        with self._lock:
+            self._pinned[identity] = now + self.sticky_seconds
+            # Drop pins nobody came back for, so the map stays bounded by recent writers
+            expired = [key for key, until in self._pinned.items() if until < now]
+            for key in expired:
+                del self._pinned[key]
+        if has_request_context():
+            g.db_pinned_identity = identity
+
+    def is_pinned(self, identity):
+        with self._lock:
+            until = self._pinned.get(identity)
+            if until is not None and until < time.monotonic():
+                del self._pinned[identity]
+                until = None
+        if until is not None:
+            return True
+        return identity is not None and has_request_context() and self._cookie_pin() == str(identity)
+
+    @staticmethod
+    def _signer():
+        return TimestampSigner(current_app.config['SECRET_KEY'], salt='replica-pin')
+
+    def _cookie_pin(self):
+        token = request.cookies.get(PIN_COOKIE)
+        if not token:
+            return None
+        try:
+            return self._signer().unsign(token, max_age=self.sticky_seconds).decode()
+        except BadSignature:
+            return None
+
+    def _send_pin(self, response):
+        identity = g.get('db_pinned_identity')
+        if identity is not None:
+            response.set_cookie(
+                PIN_COOKIE, self._signer().sign(str(identity)).decode(),
+                max_age=max(1, int(self.sticky_seconds + 0.999)), httponly=True, samesite='Lax'
+            )
+        return response
+
+
+router = ReplicaRouter()
+
+
+def use_replica():
+    """Let reads in the current request go to a replica"""
+    g.db_use_replica = True
+
+
+def _current_identity():
+    if not has_request_context():
+        return None
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and router.replicas and has_app_context() and g.get('db_use_replica'):
+            engine = g.get('db_replica_engine')
+            if engine is None and not router.is_pinned(_current_identity()):
+                # One replica per request, so the request sees a single consistent snapshot
+                engine = g.db_replica_engine = router.choose()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+def pin_current_identity():
+    """Send the current caller's reads to the primary for a while; call after committing a write"""
+    if router.replicas:
+        identity = _current_identity()
+        if identity is not None:
+            router.pin(identity)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_writer(session):
+    if session.info.pop('wrote', False):
+        pin_current_identity()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _clear_written(session):
+    session.info.pop('wrote', None)
@@ -1,19 +1,26 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
 # from flask_login import login_required, current_user
-from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance
+from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance, Holiday, WorkingDay, leave_balances_for, DEFAULT_CALENDAR
 from datetime import datetime
 
-import csv
-from io import StringIO, BytesIO
-from flask import Response, send_file
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from io import StringIO
+from flask import Response, send_file, stream_with_context
 
 from functools import wraps
+from events import publish_leave_status
+from search import search_employees
+from replicas import use_replica
+from streaming import wants_ndjson, ndjson_response, negotiates_ndjson
+from sqlalchemy import select
 
 admin_bp = Blueprint('admin', __name__)
 
+@admin_bp.before_request
+def route_reads_to_replica():
+    if request.method == 'GET':
+        use_replica()
+
 def admin_required(f):
     @wraps(f)
     @jwt_required()
@@ -27,7 +34,11 @@ def admin_required(f):
 
 @admin_bp.route('/api/admin/employees', methods=['GET'])
 @admin_required
+@negotiates_ndjson
 def get_all_employees():
+    if wants_ndjson():
+        return stream_all_employees()
+
     employees = User.query.all()
     employee_list = []
     current_year = datetime.utcnow().year
@@ -57,6 +68,60 @@ def get_all_employees():
     
     return jsonify({"employees": employee_list}), 200
 
+def stream_all_employees():
+    current_year = datetime.utcnow().year
+    stmt = (
+        select(User, EmployeeProfile)
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id)
+        .order_by(User.id)
+    )
+
+    def serialize(rows):
+        balances = leave_balances_for([employee.id for employee, _ in rows], current_year)
+        return [{
+            "id": employee.id,
+            "emp_id": employee.emp_id,
+            "email": employee.email,
+            "role": employee.role,
+            "department_id": employee.department_id,
+            "leave_balance": balances[employee.id],
+            "profile": {
+                "full_name": profile.full_name,
+                "salary": profile.salary,
+                "contact_email": profile.contact_email,
+                "phone": profile.phone
+            } if profile else None
+        } for employee, profile in rows]
+
+    return ndjson_response(stmt, serialize)
+
+@admin_bp.route('/api/admin/employees/search', methods=['GET'])
+@admin_required
+def search_all_employees():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"error": "Search query is required"}), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    rows = search_employees(q, limit=per_page + 1, offset=(page - 1) * per_page)
+    results = [{
+        "id": entry.user_id,
+        "emp_id": entry.emp_id,
+        "email": entry.email,
+        "full_name": entry.full_name,
+        "department": entry.department,
+        "score": round(float(score), 4)
+    } for entry, score in rows[:per_page]]
+
+    return jsonify({
+        "results": results,
+        "page": page,
+        "per_page": per_page,
+        "has_more": len(rows) > per_page
+    }), 200
+
 @admin_bp.route('/api/admin/employees', methods=['POST'])
 @admin_required
 def add_employee():
@@ -153,6 +218,7 @@ def get_all_departments():
         department_list.append({
             "id": dept.id,
             "name": dept.name,
+            "calendar": dept.calendar,
             "employee_count": employees
         })
     
@@ -161,6 +227,7 @@ def get_all_departments():
 @admin_bp.route('/api/admin/departments', methods=['POST'])
 @admin_required
 def add_department():
+    from workdays import rebuild_calendar
     data = request.get_json()
     
     if not data or not data.get('name'):
@@ -170,10 +237,14 @@ def add_department():
     if Department.query.filter_by(name=data['name']).first():
         return jsonify({"error": "Department with this name already exists"}), 409
     
-    new_department = Department(name=data['name'])
+    new_department = Department(name=data['name'], calendar=data.get('calendar', DEFAULT_CALENDAR))
     
     try:
         db.session.add(new_department)
+        db.session.flush()
+        if not WorkingDay.query.filter_by(calendar=new_department.calendar).first():
+            # First department on this calendar: build its prefix sums
+            rebuild_calendar(new_department.calendar)
         db.session.commit()
         return jsonify({
             "message": "Department added successfully",
@@ -186,7 +257,11 @@ def add_department():
 
 @admin_bp.route('/api/admin/leave-requests', methods=['GET'])
 @admin_required
+@negotiates_ndjson
 def get_all_leave_requests():
+    if wants_ndjson():
+        return stream_all_leave_requests()
+
     leave_requests = LeaveRequest.query.all()
     request_list = []
     current_year = datetime.utcnow().year
@@ -209,6 +284,29 @@ def get_all_leave_requests():
     
     return jsonify({"leave_requests": request_list}), 200
 
+def stream_all_leave_requests():
+    current_year = datetime.utcnow().year
+    stmt = (
+        select(LeaveRequest, EmployeeProfile.full_name)
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == LeaveRequest.employee_id)
+        .order_by(LeaveRequest.id)
+    )
+
+    def serialize(rows):
+        balances = leave_balances_for({leave.employee_id for leave, _ in rows}, current_year)
+        return [{
+            "id": leave.id,
+            "employee_id": leave.employee_id,
+            "employee_name": full_name or "Unknown",
+            "start_date": leave.start_date.strftime('%Y-%m-%d'),
+            "end_date": leave.end_date.strftime('%Y-%m-%d'),
+            "status": leave.status,
+            "reason": leave.reason,
+            "leave_balance": balances[leave.employee_id]
+        } for leave, full_name in rows]
+
+    return ndjson_response(stmt, serialize)
+
 @admin_bp.route('/api/admin/leave-requests/<int:request_id>', methods=['PUT'])
 @admin_required
 def update_leave_request(request_id):
@@ -227,6 +325,7 @@ def update_leave_request(request_id):
     try:
         leave_request.status = data['status']
         db.session.commit()
+        publish_leave_status(leave_request)
         return jsonify({"message": "Leave request updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
@@ -235,11 +334,19 @@ def update_leave_request(request_id):
 @admin_bp.route('/api/admin/attendance/<emp_id>', methods=['GET'])
 @admin_required
 def get_employee_attendance(emp_id):
+    from partitions import parse_date_range, filter_attendance_dates
     user = User.query.filter_by(emp_id=emp_id).first()
     if not user:
         return jsonify({"error": "Employee not found"}), 404
 
-    attendance_records = Attendance.query.filter_by(user_id=user.id).all()
+    try:
+        start_date, end_date = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    attendance_records = filter_attendance_dates(
+        Attendance.query.filter_by(user_id=user.id), start_date, end_date
+    ).order_by(Attendance.date).all()
     records = [{
         "date": record.date.strftime('%Y-%m-%d'),
         "status": record.status,
@@ -254,11 +361,23 @@ def get_employee_attendance(emp_id):
 
 @admin_bp.route('/api/admin/attendance', methods=['GET'])
 @admin_required
+@negotiates_ndjson
 def get_all_attendance():
+    from partitions import parse_date_range, filter_attendance_dates
+    try:
+        start_date, end_date = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    if wants_ndjson():
+        return stream_all_attendance(start_date, end_date)
+
     users = User.query.all()
     all_attendance = []
     for user in users:
-        attendance_records = Attendance.query.filter_by(user_id=user.id).all()
+        attendance_records = filter_attendance_dates(
+            Attendance.query.filter_by(user_id=user.id), start_date, end_date
+        ).order_by(Attendance.date).all()
         records = [{
             "date": record.date.strftime('%Y-%m-%d'),
             "status": record.status,
@@ -271,6 +390,29 @@ def get_all_attendance():
         })
     return jsonify({"all_attendance": all_attendance}), 200
 
+def stream_all_attendance(start_date=None, end_date=None):
+    from partitions import filter_attendance_dates
+    stmt = filter_attendance_dates(
+        select(
+            User.emp_id, Attendance.date, Attendance.status,
+            Attendance.check_in_time, Attendance.check_out_time
+        )
+        .join(User, User.id == Attendance.user_id)
+        .order_by(Attendance.user_id, Attendance.date),
+        start_date, end_date
+    )
+
+    def serialize(rows):
+        return [{
+            "emp_id": emp_id,
+            "date": record_date.strftime('%Y-%m-%d'),
+            "status": status,
+            "check_in_time": check_in_time.strftime('%H:%M:%S') if check_in_time else None,
+            "check_out_time": check_out_time.strftime('%H:%M:%S') if check_out_time else None
+        } for emp_id, record_date, status, check_in_time, check_out_time in rows]
+
+    return ndjson_response(stmt, serialize)
+
 @admin_bp.route('/api/admin/leave-balance/<emp_id>', methods=['GET'])
 @admin_required
 def get_employee_leave_balance(emp_id):
@@ -288,109 +430,86 @@ def get_employee_leave_balance(emp_id):
 @admin_bp.route('/api/admin/leave-balances', methods=['GET'])
 @admin_required
 def get_all_leave_balances():
-    users = User.query.all()
+    users = db.session.query(User.id, User.emp_id).all()
     current_year = datetime.utcnow().year
+    leave_balances = leave_balances_for([user.id for user in users], current_year)
     balances = []
     for user in users:
         balances.append({
             "emp_id": user.emp_id,
-            "leave_balance": user.leave_balance(year=current_year)
+            "leave_balance": leave_balances[user.id]
         })
     return jsonify({"leave_balances": balances}), 200
 
-def generate_employee_csv(user):
-    output = StringIO()
-    writer = csv.writer(output)
-    profile = user.profile
-
-    writer.writerow(['Employee Details'])
-    writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
-    writer.writerow([
-        user.emp_id,
-        profile.full_name if profile else '',
-        user.email,
-        user.role,
-        user.department.name if user.department else '',
-        user.leave_balance(datetime.utcnow().year)
-    ])
-    writer.writerow([])
-
-    writer.writerow(['Attendance'])
-    writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
-    for record in user.attendance:
-        writer.writerow([
-            record.date.strftime('%Y-%m-%d'),
-            record.status,
-            record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
-            record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
-        ])
-    writer.writerow([])
-
-    writer.writerow(['Leave Requests'])
-    writer.writerow(['start_date', 'end_date', 'reason', 'status'])
-    for leave in user.leave_requests:
-        writer.writerow([
-            leave.start_date.strftime('%Y-%m-%d'),
-            leave.end_date.strftime('%Y-%m-%d'),
-            leave.reason,
-            leave.status
-        ])
-    return output.getvalue()
-
-def generate_employee_pdf(user):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 40
-    profile = user.profile
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Employee Details")
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawString(40, y, f"ID: {user.emp_id}")
-    y -= 15
-    p.drawString(40, y, f"Name: {profile.full_name if profile else ''}")
-    y -= 15
-    p.drawString(40, y, f"Email: {user.email}")
-    y -= 15
-    p.drawString(40, y, f"Role: {user.role}")
-    y -= 15
-    p.drawString(40, y, f"Department: {user.department.name if user.department else ''}")
-    y -= 15
-    p.drawString(40, y, f"Leave Balance: {user.leave_balance(datetime.utcnow().year)}")
-    y -= 30
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Attendance")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for record in user.attendance:
-        p.drawString(40, y, f"{record.date.strftime('%Y-%m-%d')}, {record.status}, {record.check_in_time or ''}, {record.check_out_time or ''}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    y -= 20
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Leave Requests")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for leave in user.leave_requests:
-        p.drawString(40, y, f"{leave.start_date.strftime('%Y-%m-%d')} to {leave.end_date.strftime('%Y-%m-%d')}, {leave.reason}, {leave.status}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    p.save()
-    buffer.seek(0)
-    return buffer
+@admin_bp.route('/api/admin/holidays', methods=['GET'])
+@admin_required
+def get_holidays():
+    calendar = request.args.get('calendar', DEFAULT_CALENDAR)
+    holidays = Holiday.query.filter_by(calendar=calendar).order_by(Holiday.date).all()
+    return jsonify({
+        "calendar": calendar,
+        "holidays": [{
+            "id": holiday.id,
+            "date": holiday.date.strftime('%Y-%m-%d'),
+            "name": holiday.name
+        } for holiday in holidays]
+    }), 200
+
+@admin_bp.route('/api/admin/holidays', methods=['POST'])
+@admin_required
+def add_holiday():
+    from workdays import rebuild_calendar
+    data = request.get_json()
+
+    required_fields = ['date', 'name']
+    for field in required_fields:
+        if not data or field not in data:
+            return jsonify({"error": f"Missing required field: {field}"}), 400
+
+    try:
+        holiday_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    calendar = data.get('calendar', DEFAULT_CALENDAR)
+    if Holiday.query.filter_by(calendar=calendar, date=holiday_date).first():
+        return jsonify({"error": "Holiday already exists for this date"}), 409
+
+    holiday = Holiday(calendar=calendar, date=holiday_date, name=data['name'])
+    try:
+        db.session.add(holiday)
+        db.session.flush()
+        rebuild_calendar(calendar)
+        db.session.commit()
+        return jsonify({"message": "Holiday added successfully", "id": holiday.id}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route('/api/admin/holidays/<int:holiday_id>', methods=['DELETE'])
+@admin_required
+def delete_holiday(holiday_id):
+    from workdays import rebuild_calendar
+    holiday = Holiday.query.get(holiday_id)
+    if not holiday:
+        return jsonify({"error": "Holiday not found"}), 404
+
+    try:
+        calendar = holiday.calendar
+        db.session.delete(holiday)
+        db.session.flush()
+        rebuild_calendar(calendar)
+        db.session.commit()
+        return jsonify({"message": "Holiday deleted successfully"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
 
 @admin_bp.route('/api/admin/export-employee', methods=['GET'])
 @admin_required
 def export_employee_data_csv():
+    from exports import generate_employee_csv
+
     emp_id = request.args.get('emp_id')
     output = StringIO()
     if emp_id:
@@ -414,6 +533,8 @@ def export_employee_data_csv():
 @admin_bp.route('/api/admin/export-employee-pdf', methods=['GET'])
 @admin_required
 def export_employee_data_pdf():
+    from exports import generate_employee_pdf
+
     emp_id = request.args.get('emp_id')
     if emp_id:
         user = User.query.filter_by(emp_id=emp_id).first()
@@ -422,4 +543,78 @@ def export_employee_data_pdf():
         pdf_buffer = generate_employee_pdf(user)
         return send_file(pdf_buffer, as_attachment=True, download_name='employee_data.pdf', mimetype='application/pdf')
     else:
-        return jsonify({"error": "PDF export for all users not implemented"}), 400
\ No newline at end of file
+        return jsonify({"error": "PDF export for all users not implemented"}), 400
+
+@admin_bp.route('/api/admin/export/<any(attendance, leave):dataset>.<any(parquet, arrow):fmt>', methods=['GET'])
+@admin_required
+def export_columnar(dataset, fmt):
+    import exports
+
+    try:
+        filters = exports.parse_export_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if dataset == 'attendance':
+        stmt = exports.attendance_query(**filters)
+        schema = exports.attendance_schema()
+    else:
+        stmt = exports.leave_query(**filters)
+        schema = exports.leave_schema()
+
+    mimetype = 'application/vnd.apache.parquet' if fmt == 'parquet' else 'application/vnd.apache.arrow.stream'
+    return Response(
+        stream_with_context(exports.stream_table(stmt, schema, fmt)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename={dataset}.{fmt}"}
+    )
+
+@admin_bp.route('/api/admin/changes', methods=['GET'])
+@admin_required
+def get_changes():
+    from changes import changes_since, parse_token, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+    since = request.args.get('since', '0')
+    try:
+        parse_token(since)
+    except ValueError:
+        return jsonify({"error": "Invalid since token"}), 400
+    limit = min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
+    changes, next_token, has_more = changes_since(since, limit)
+    return jsonify({
+        "changes": changes,
+        "next_token": next_token,
+        "has_more": has_more
+    }), 200
+
+@admin_bp.route('/api/admin/admission', methods=['GET'])
+@admin_required
+def get_admission_stats():
+    from admission import admission
+    return jsonify(admission.stats()), 200
+
+@admin_bp.route('/api/admin/audit', methods=['GET'])
+@admin_required
+def get_audit_log():
+    from audit import query_audit_log
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use ISO 8601 (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)"}), 400
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    entries = query_audit_log(
+        actor_id=request.args.get('actor_id', type=int),
+        entity=request.args.get('entity'),
+        entity_id=request.args.get('entity_id', type=int),
+        since=since,
+        until=until,
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({"entries": entries, "limit": limit, "offset": offset}), 200
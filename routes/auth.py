@@ -16,8 +16,10 @@ def login():
     if not user or not check_password_hash(user.password_hash, data['password']):
         return jsonify({"error": "Invalid credentials"}), 401
 
-    access_token = create_access_token(identity=str(user.id))
-    refresh_token = create_refresh_token(identity=str(user.id))
+    # The role claim lets admission control pick a quota without a database lookup
+    claims = {"role": user.role}
+    access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+    refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
     return jsonify({
         "message": "Login successful",
         "access_token": access_token,
@@ -33,7 +35,11 @@ def login():
 @jwt_required(refresh=True)
 def refresh():
     identity = get_jwt_identity()
-    access_token = create_access_token(identity=identity)
+    user = User.query.get(identity)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    # The current role rather than the refresh token's: it may predate a role change, or the claim
+    access_token = create_access_token(identity=identity, additional_claims={"role": user.role})
     return jsonify(access_token=access_token), 200
 
 # Define a simple in-memory blacklist set at the top of the file or import it if defined elsewhere
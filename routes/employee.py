@@ -1,18 +1,25 @@
 from flask import Blueprint, request, jsonify
 # from flask_login import login_required, current_user
-from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance
+from models import db, User, EmployeeProfile, Department, LeaveRequest, Attendance, leave_balances_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
+from events import publish_leave_pending, publish_attendance
+from replicas import use_replica
+from sqlalchemy import select
 
-import csv
-from io import StringIO, BytesIO
+from io import StringIO
 from flask import Response, send_file
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 
 
 employee_bp = Blueprint('employee', __name__)
 
+DASHBOARD_SECTIONS = ('profile', 'leave_balance', 'leave_requests', 'attendance')
+
+@employee_bp.before_request
+def route_reads_to_replica():
+    if request.method == 'GET':
+        use_replica()
+
 @employee_bp.route('/api/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
@@ -68,6 +75,7 @@ def update_contact_info():
 @employee_bp.route('/api/leave', methods=['POST'])
 @jwt_required()
 def submit_leave_request():
+    from sqlite_mode import run_write, WriteTimeout
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     data = request.get_json()
@@ -84,16 +92,21 @@ def submit_leave_request():
         if start_date > end_date:
             return jsonify({"error": "Start date cannot be after end date"}), 400
 
-        leave_request = LeaveRequest(
-            employee_id=user.id,
-            start_date=start_date,
-            end_date=end_date,
-            reason=data['reason'],
-            status='pending_manager'
-        )
+        def create_leave_request(session):
+            leave_request = LeaveRequest(
+                employee_id=user.id,
+                start_date=start_date,
+                end_date=end_date,
+                reason=data['reason'],
+                status='pending_manager'
+            )
+            session.add(leave_request)
+            return leave_request
 
-        db.session.add(leave_request)
-        db.session.commit()
+        leave_request = run_write(create_leave_request)
+
+        approvers = [f'user:{user.manager_id}'] if user.manager_id else ['role:manager']
+        publish_leave_pending(leave_request, approvers)
 
         return jsonify({
             "message": "Leave request submitted successfully",
@@ -102,6 +115,8 @@ def submit_leave_request():
         }), 201
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+    except WriteTimeout as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -128,9 +143,17 @@ def get_leave_requests():
 @employee_bp.route('/api/attendance', methods=['GET'])
 @jwt_required()
 def get_self_attendance():
+    from partitions import parse_date_range, filter_attendance_dates
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
-    attendance_records = Attendance.query.filter_by(user_id=user.id).all()
+    try:
+        start_date, end_date = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    attendance_records = filter_attendance_dates(
+        Attendance.query.filter_by(user_id=user.id), start_date, end_date
+    ).order_by(Attendance.date).all()
     records = [{
         "date": record.date.strftime('%Y-%m-%d'),
         "status": record.status,
@@ -146,6 +169,7 @@ def get_self_attendance():
 @employee_bp.route('/api/attendance', methods=['POST'])
 @jwt_required()
 def mark_attendance():
+    from sqlite_mode import run_write, WriteTimeout
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     data = request.get_json()
@@ -154,22 +178,106 @@ def mark_attendance():
     check_in_time = data.get('check_in_time')
     check_out_time = data.get('check_out_time')
 
-    attendance = Attendance.query.filter_by(user_id=user.id, date=today).first()
-    if attendance:
-        return jsonify({"error": "Attendance already marked for today"}), 400
+    def record_attendance(session):
+        # Checked inside the write so two concurrent requests can't both mark the day
+        if session.query(Attendance.id).filter_by(user_id=user.id, date=today).first():
+            return None
+        attendance = Attendance(
+            user_id=user.id,
+            date=today,
+            status=status,
+            check_in_time=check_in_time,
+            check_out_time=check_out_time
+        )
+        session.add(attendance)
+        return attendance
 
-    attendance = Attendance(
-        user_id=user.id,
-        date=today,
-        status=status,
-        check_in_time=check_in_time,
-        check_out_time=check_out_time
-    )
-    db.session.add(attendance)
-    db.session.commit()
+    try:
+        attendance = run_write(record_attendance)
+    except WriteTimeout as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    if attendance is None:
+        return jsonify({"error": "Attendance already marked for today"}), 400
+    publish_attendance(attendance)
     return jsonify({"message": "Attendance marked"}), 201
 
 
+@employee_bp.route('/api/me/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard():
+    from partitions import filter_attendance_dates
+    include = request.args.get('include')
+    sections = set(include.split(',')) if include else set(DASHBOARD_SECTIONS)
+    unknown = sections - set(DASHBOARD_SECTIONS)
+    if unknown:
+        return jsonify({"error": f"Unknown dashboard section: {', '.join(sorted(unknown))}"}), 400
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    leave_limit = min(max(request.args.get('leave_limit', 10, type=int), 1), 100)
+
+    # One query for user, profile and department; at most one more per section
+    row = db.session.execute(
+        select(User, EmployeeProfile, Department)
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .where(User.id == get_jwt_identity())
+    ).first()
+    if not row:
+        return jsonify({"error": "User not found"}), 404
+    user, profile, department = row
+
+    dashboard = {
+        "employee": {
+            "id": user.id,
+            "emp_id": user.emp_id,
+            "email": user.email,
+            "role": user.role
+        }
+    }
+
+    if 'profile' in sections:
+        dashboard["department"] = department.name if department else None
+        dashboard["profile"] = {
+            "full_name": profile.full_name,
+            "contact_email": profile.contact_email,
+            "phone": profile.phone
+        } if profile else None
+
+    if 'leave_balance' in sections:
+        dashboard["leave_balance"] = leave_balances_for([user.id], datetime.utcnow().year)[user.id]
+
+    if 'leave_requests' in sections:
+        leave_requests = (
+            LeaveRequest.query
+            .filter_by(employee_id=user.id)
+            .order_by(LeaveRequest.created_at.desc(), LeaveRequest.id.desc())
+            .limit(leave_limit)
+            .all()
+        )
+        dashboard["leave_requests"] = [{
+            "id": leave.id,
+            "start_date": leave.start_date.strftime('%Y-%m-%d'),
+            "end_date": leave.end_date.strftime('%Y-%m-%d'),
+            "reason": leave.reason,
+            "status": leave.status
+        } for leave in leave_requests]
+
+    if 'attendance' in sections:
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        attendance_records = filter_attendance_dates(
+            Attendance.query.filter_by(user_id=user.id), since, None
+        ).order_by(Attendance.date.desc()).all()
+        dashboard["attendance"] = [{
+            "date": record.date.strftime('%Y-%m-%d'),
+            "status": record.status,
+            "check_in_time": record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else None,
+            "check_out_time": record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else None
+        } for record in attendance_records]
+
+    return jsonify(dashboard), 200
+
 @employee_bp.route('/api/leave-balance', methods=['GET'])
 @jwt_required()
 def get_self_leave_balance():
@@ -182,48 +290,11 @@ def get_self_leave_balance():
         "leave_balance": leave_balance
     }), 200
 
-def generate_employee_csv(user):
-    output = StringIO()
-    writer = csv.writer(output)
-    profile = user.profile
-
-    writer.writerow(['Employee Details'])
-    writer.writerow(['emp_id', 'full_name', 'email', 'role', 'department', 'leave_balance'])
-    writer.writerow([
-        user.emp_id,
-        profile.full_name if profile else '',
-        user.email,
-        user.role,
-        user.department.name if user.department else '',
-        user.leave_balance(datetime.utcnow().year)
-    ])
-    writer.writerow([])
-
-    writer.writerow(['Attendance'])
-    writer.writerow(['date', 'status', 'check_in_time', 'check_out_time'])
-    for record in user.attendance:
-        writer.writerow([
-            record.date.strftime('%Y-%m-%d'),
-            record.status,
-            record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else '',
-            record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else ''
-        ])
-    writer.writerow([])
-
-    writer.writerow(['Leave Requests'])
-    writer.writerow(['start_date', 'end_date', 'reason', 'status'])
-    for leave in user.leave_requests:
-        writer.writerow([
-            leave.start_date.strftime('%Y-%m-%d'),
-            leave.end_date.strftime('%Y-%m-%d'),
-            leave.reason,
-            leave.status
-        ])
-    return output.getvalue()
-
 @employee_bp.route('/api/export-self', methods=['GET'])
 @jwt_required()
 def export_self_data_csv():
+    from exports import generate_employee_csv
+
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     csv_data = generate_employee_csv(user)
@@ -234,60 +305,11 @@ def export_self_data_csv():
         headers={"Content-Disposition": "attachment;filename=employee_data.csv"}
     )
 
-def generate_employee_pdf(user):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 40
-    profile = user.profile
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Employee Details")
-    y -= 20
-    p.setFont("Helvetica", 12)
-    p.drawString(40, y, f"ID: {user.emp_id}")
-    y -= 15
-    p.drawString(40, y, f"Name: {profile.full_name if profile else ''}")
-    y -= 15
-    p.drawString(40, y, f"Email: {user.email}")
-    y -= 15
-    p.drawString(40, y, f"Role: {user.role}")
-    y -= 15
-    p.drawString(40, y, f"Department: {user.department.name if user.department else ''}")
-    y -= 15
-    p.drawString(40, y, f"Leave Balance: {user.leave_balance(datetime.utcnow().year)}")
-    y -= 30
-
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Attendance")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for record in user.attendance:
-        p.drawString(40, y, f"{record.date.strftime('%Y-%m-%d')}, {record.status}, {record.check_in_time or ''}, {record.check_out_time or ''}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    y -= 20
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(40, y, "Leave Requests")
-    y -= 20
-    p.setFont("Helvetica", 10)
-    for leave in user.leave_requests:
-        p.drawString(40, y, f"{leave.start_date.strftime('%Y-%m-%d')} to {leave.end_date.strftime('%Y-%m-%d')}, {leave.reason}, {leave.status}")
-        y -= 12
-        if y < 60:
-            p.showPage()
-            y = height - 40
-
-    p.save()
-    buffer.seek(0)
-    return buffer
-
 @employee_bp.route('/api/export-self-pdf', methods=['GET'])
 @jwt_required()
 def export_self_data_pdf():
+    from exports import generate_employee_pdf
+
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     pdf_buffer = generate_employee_pdf(user)
@@ -0,0 +1,61 @@
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from models import User
+from events import broker, issue_stream_token, read_stream_token, STREAM_TOKEN_MAX_AGE
+
+import json
+import queue
+
+events_bp = Blueprint('events', __name__)
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+# EventSource can't set headers: browsers swap their access token for a stream token here
+# and open /api/events?stream_token=... with it
+@events_bp.route('/api/events/token', methods=['POST'])
+@jwt_required()
+def create_stream_token():
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"stream_token": issue_stream_token(user), "expires_in": STREAM_TOKEN_MAX_AGE}), 200
+
+@events_bp.route('/api/events', methods=['GET'])
+def stream_events():
+    stream_token = request.args.get('stream_token')
+    if stream_token:
+        claims = read_stream_token(stream_token)
+        if claims is None:
+            return jsonify({"error": "Invalid or expired stream token"}), 401
+        user_id = claims[0]
+    else:
+        verify_jwt_in_request()
+        user_id = get_jwt_identity()
+
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    channels = [f'user:{user.id}', f'role:{user.role}']
+    subscription = broker.subscribe(channels)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = subscription.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            broker.unsubscribe(subscription, channels)
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, LeaveRequest, User, EmployeeProfile
 from functools import wraps
+from events import publish_leave_status, publish_leave_pending
 
 manager_bp = Blueprint('manager', __name__)
 
@@ -31,6 +32,8 @@ def manager_update_leave_request(request_id):
     try:
         leave_request.status = 'pending_admin'
         db.session.commit()
+        publish_leave_status(leave_request)
+        publish_leave_pending(leave_request, ['role:admin'])
         return jsonify({"message": "Leave request forwarded to admin"}), 200
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,187 @@
+"""Employee directory search.
+
+Searchable fields are denormalised into `employee_search`, kept in sync from
+the session whenever a user, profile or department changes. Postgres serves
+queries from a pg_trgm GIN index; SQLite from an FTS5 trigram table that
+triggers keep in step with `employee_search`.
+"""
+from sqlalchemy import event, func, select, text, literal, union, case
+from sqlalchemy.orm import Session
+
+from models import db, User, EmployeeProfile, Department, EmployeeSearch
+
+
+def _document_rows(user_ids=None):
+    """Select producing employee_search rows for the given users (all users when None)"""
+    full_name = func.coalesce(EmployeeProfile.full_name, '')
+    department = func.coalesce(Department.name, '')
+    stmt = (
+        select(
+            User.id, User.emp_id, User.email, EmployeeProfile.full_name, Department.name,
+            func.lower(full_name + literal(' ') + User.emp_id + literal(' ') + User.email + literal(' ') + department)
+        )
+        .outerjoin(EmployeeProfile, EmployeeProfile.user_id == User.id)
+        .outerjoin(Department, Department.id == User.department_id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(User.id.in_(user_ids))
+    return stmt
+
+
+def _refresh(connection, user_ids=None):
+    table = EmployeeSearch.__table__
+    delete = table.delete()
+    if user_ids is not None:
+        delete = delete.where(table.c.user_id.in_(user_ids))
+    connection.execute(delete)
+    connection.execute(table.insert().from_select(
+        ['user_id', 'emp_id', 'email', 'full_name', 'department', 'document'],
+        _document_rows(user_ids)
+    ))
+
+
+@event.listens_for(Session, 'after_flush')
+def sync_search_index(session, flush_context):
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, EmployeeProfile):
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, Department) and obj in session.dirty:
+            user_ids.update(
+                session.execute(select(User.id).where(User.department_id == obj.id)).scalars()
+            )
+    user_ids.discard(None)
+    if user_ids:
+        _refresh(session.connection(), sorted(user_ids))
+
+
+def ensure_search_index():
+    """Populate the search table on first boot against an existing database"""
+    if db.session.query(EmployeeSearch.user_id).first() is None and db.session.query(User.id).first() is not None:
+        rebuild_search_index()
+
+
+def rebuild_search_index():
+    _refresh(db.session.connection())
+    db.session.commit()
+
+
+# FTS hits and prefix matches per column considered for each SQLite search
+SEARCH_CANDIDATES = 200
+
+
+def _trigrams(term):
+    return sorted({term[i:i + 3] for i in range(len(term) - 2)})
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _fts_has_match(match):
+    return db.session.execute(
+        text("SELECT 1 FROM employee_search_fts WHERE employee_search_fts MATCH :match LIMIT 1"),
+        {"match": match}
+    ).first() is not None
+
+
+def _sqlite_match(term):
+    """FTS5 query for the term, loosened step by step until something matches.
+
+    A quoted phrase is a substring match. For typos, first accept rows sharing
+    any 4-character piece of the term (two adjacent trigrams), then any single
+    trigram. Returns None when nothing matches at all.
+    """
+    stages = [[term]]
+    if len(term) > 4:
+        stages.append(sorted({term[i:i + 4] for i in range(len(term) - 3)}))
+    if len(term) > 3:
+        stages.append(_trigrams(term))
+    for pieces in stages:
+        match = ' OR '.join(_fts_phrase(piece) for piece in pieces)
+        if _fts_has_match(match):
+            return match
+    return None
+
+
+def _trigram_score(term):
+    """Share of the term's trigrams found in the document, 0..1 like Postgres' word_similarity"""
+    grams = _trigrams(term)
+    found = [case((func.instr(EmployeeSearch.document, gram) > 0, 1), else_=0) for gram in grams]
+    return (sum(found[1:], found[0]) * 1.0 / len(grams)).label('score')
+
+
+def _like_prefix(term):
+    """LIKE pattern matching values that start with `term`, wildcards in the term escaped"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _prefix_match(term):
+    pattern = _like_prefix(term)
+    return (
+        EmployeeSearch.emp_id.ilike(pattern, escape='\\')
+        | EmployeeSearch.full_name.ilike(pattern, escape='\\')
+        | EmployeeSearch.email.ilike(pattern, escape='\\')
+    )
+
+
+def _sqlite_prefix_candidates(term, count):
+    """Up to `count` users per column whose emp_id, name or email starts with the term.
+    Plain LIKE is case-insensitive on SQLite and can use the NOCASE indexes."""
+    pattern = _like_prefix(term)
+    return [
+        select(EmployeeSearch.user_id).where(column.like(pattern, escape='\\')).limit(count).subquery()
+        for column in (EmployeeSearch.emp_id, EmployeeSearch.full_name, EmployeeSearch.email)
+    ]
+
+
+def search_employees(q, limit, offset):
+    """Return ranked (EmployeeSearch, score) pairs for the query string"""
+    term = ' '.join(q.lower().split())
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        score = func.word_similarity(term, EmployeeSearch.document)
+        prefix = _prefix_match(term)
+        stmt = (
+            select(EmployeeSearch, score)
+            .where(EmployeeSearch.document.contains(term, autoescape=True) | EmployeeSearch.document.op('%>')(term))
+            .order_by(prefix.desc(), score.desc(), EmployeeSearch.user_id)
+        )
+    elif dialect == 'sqlite' and len(term) >= 3:
+        match = _sqlite_match(term)
+        # Re-rank a bounded candidate set rather than every row that matched: FTS hits in
+        # rowid order plus indexed prefix matches. bm25 would have to score every hit first.
+        count = max(SEARCH_CANDIDATES, offset + limit)
+        fts = text(
+            "SELECT rowid AS user_id FROM employee_search_fts "
+            "WHERE employee_search_fts MATCH :match LIMIT :count"
+        ).bindparams(match=match or '""', count=count).columns(user_id=db.Integer).subquery()
+        candidates = union(
+            select(fts.c.user_id),
+            *[select(prefix.c.user_id) for prefix in _sqlite_prefix_candidates(term, count)]
+        ).subquery()
+        score = _trigram_score(term)
+        stmt = (
+            select(EmployeeSearch, score)
+            .join(candidates, candidates.c.user_id == EmployeeSearch.user_id)
+            .order_by(_prefix_match(term).desc(), EmployeeSearch.document.contains(term, autoescape=True).desc(),
+                      score.desc(), EmployeeSearch.user_id)
+        )
+    else:
+        # Too short for trigrams: indexed prefix match (LIKE is case-insensitive on SQLite)
+        pattern = _like_prefix(term)
+        stmt = (
+            select(EmployeeSearch, literal(1.0))
+            .where(
+                EmployeeSearch.emp_id.like(pattern, escape='\\')
+                | EmployeeSearch.full_name.like(pattern, escape='\\')
+                | EmployeeSearch.email.like(pattern, escape='\\')
+                | EmployeeSearch.department.like(pattern, escape='\\')
+            )
+            .order_by(EmployeeSearch.emp_id)
+        )
+
+    return db.session.execute(stmt.limit(limit).offset(offset)).all()
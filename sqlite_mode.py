@@ -0,0 +1,202 @@
+"""Single-node SQLite deployment mode.
+
+When the database is a SQLite file:
+
+* every connection gets WAL journaling and tuned pragmas, so readers never
+  block the writer and a busy writer makes others wait instead of failing;
+* request threads keep reading through db.session's pool, while the hot
+  write paths (see `run_write`) are handed to one writer thread with its own
+  connection. The writer drains whatever jobs are queued and commits them as
+  one transaction, so many concurrent writes cost one fsync and never race
+  each other for the lock.
+
+Only the employee write paths that every user hits daily (leave requests and
+attendance) go through the writer. Admin and manager writes are rare and
+still commit on db.session; they wait out the writer's lock through
+busy_timeout like any other connection.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+from replicas import pin_current_identity
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Most jobs committed in one writer transaction
+WRITE_BATCH_SIZE = 64
+
+# Seconds a request waits for its write before giving up
+WRITE_TIMEOUT = 30
+
+
+class WriteTimeout(Exception):
+    """The writer didn't get to a write within WRITE_TIMEOUT. `applied` is False when the
+    write was withdrawn before it started, None when it was already running and may still land."""
+
+    def __init__(self, message, applied):
+        super().__init__(message)
+        self.applied = applied
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _begin_immediate(engine):
+    # Take the write lock when the transaction starts rather than on its first write,
+    # so the writer never has to upgrade a read lock mid-transaction
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+class _WriteJob:
+    def __init__(self, fn, info):
+        self.fn = fn
+        self.info = info
+        self.future = Future()
+
+
+class SQLiteWriteQueue:
+    def __init__(self):
+        self.engine = None
+        self._jobs = queue.Queue()
+        self._thread = None
+
+    @property
+    def active(self):
+        return self._thread is not None
+
+    def start(self, uri):
+        self.engine = sa.create_engine(
+            uri, pool_size=1, max_overflow=0,
+            connect_args={'check_same_thread': False, 'timeout': 30}
+        )
+        event.listen(self.engine, 'connect', apply_pragmas)
+        _begin_immediate(self.engine)
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, info=None):
+        """Queue `fn(session)`; the returned future resolves to its result once committed"""
+        job = _WriteJob(fn, info or {})
+        self._jobs.put(job)
+        return job.future
+
+    def _take_batch(self):
+        batch = [self._jobs.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(self._jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        session = Session(bind=self.engine, expire_on_commit=False)
+        while True:
+            # Jobs whose request gave up waiting before they started are dropped
+            batch = [job for job in self._take_batch() if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = [self._execute(session, job) for job in batch]
+                session.commit()
+            except Exception:
+                session.rollback()
+                # One bad job must not sink the others: replay them one at a time
+                for job in batch:
+                    self._run_alone(session, job)
+                continue
+            for job, result in zip(batch, results):
+                job.future.set_result(result)
+            session.expunge_all()
+
+    @staticmethod
+    def _execute(session, job):
+        session.info.update(job.info)
+        try:
+            result = job.fn(session)
+            session.flush()
+            return result
+        finally:
+            for key in job.info:
+                session.info.pop(key, None)
+
+    def _run_alone(self, session, job):
+        try:
+            result = self._execute(session, job)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        session.expunge_all()
+
+
+write_queue = SQLiteWriteQueue()
+
+
+def init_sqlite_mode(app):
+    """Turn on pragmas and the writer thread when the primary database is a SQLite file"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not uri.startswith('sqlite'):
+        return
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', apply_pragmas)
+        is_file = db.engine.url.database not in (None, '', ':memory:')
+
+    if is_file and app.config.get('SQLITE_WRITE_QUEUE', True) and not write_queue.active:
+        with app.app_context():
+            write_queue.start(db.engine.url)
+
+
+def run_write(fn, info=None):
+    """Run `fn(session)` and commit: on the SQLite writer thread when it is running,
+    otherwise inline on db.session. Returns whatever `fn` returned.
+
+    Raises WriteTimeout when the writer hasn't finished the write within WRITE_TIMEOUT;
+    a write that hadn't started yet is withdrawn, one that had may still be committed.
+    """
+    if write_queue.active:
+        from audit import current_context
+        # The writer thread has no request context, so carry the audit actor along
+        info = dict(info or {}, audit_context=current_context())
+        future = write_queue.submit(fn, info)
+        try:
+            result = future.result(timeout=WRITE_TIMEOUT)
+        except TimeoutError:
+            if future.cancel():
+                raise WriteTimeout("Server busy, the change was not saved. Try again shortly", False)
+            if not future.done():
+                raise WriteTimeout("Server busy, the change may still be saved. Check before retrying", None)
+            # Finished just as the wait ran out
+            result = future.result()
+        # The writer's plain Session bypasses the replica router's commit hook, so pin here
+        pin_current_identity()
+        return result
+    result = fn(db.session)
+    db.session.commit()
+    return result
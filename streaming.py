@@ -0,0 +1,59 @@
+"""Newline-delimited JSON streaming for the bulk list endpoints.
+
+Rows come off a server-side cursor (`yield_per`) one chunk at a time and are
+written out as they are serialised, optionally gzip-compressed on the fly, so
+memory stays flat and the first line goes out as soon as the first chunk is
+read.
+"""
+import json
+import zlib
+from functools import wraps
+
+from flask import Response, make_response, request, stream_with_context
+
+from models import db
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Rows fetched per round trip to the database
+STREAM_CHUNK_SIZE = 1000
+
+
+def wants_ndjson():
+    """True when the client prefers NDJSON over the regular JSON document"""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def negotiates_ndjson(view):
+    """For views that answer JSON or NDJSON depending on Accept: say so on every response,
+    so a cache never hands one representation to a client that asked for the other"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        response.vary.add('Accept')
+        return response
+    return wrapper
+
+
+def ndjson_response(stmt, serialize_chunk, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream `stmt` as NDJSON; `serialize_chunk` turns a list of rows into a list of dicts"""
+    use_gzip = request.accept_encodings['gzip'] > 0
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if use_gzip else None
+        result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            data = ''.join(
+                json.dumps(item, separators=(',', ':')) + '\n' for item in serialize_chunk(rows)
+            ).encode()
+            if compressor:
+                # Sync flush so every chunk reaches the client without waiting for the next one
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+        if compressor:
+            yield compressor.flush()
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers=headers)
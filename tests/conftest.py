@@ -0,0 +1,57 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    monkeypatch.setenv('AUTO_CREATE_SCHEMA', '1')
+    monkeypatch.setenv('ADMISSION_ENABLED', '0')
+    monkeypatch.setenv('AUDIT_ENABLED', '0')
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Factory for committed users with a profile: make_user(role='employee', department=None, full_name=None)"""
+    from models import db, User, EmployeeProfile
+    numbers = itertools.count(1)
+
+    def make(role='employee', department=None, full_name=None):
+        number = next(numbers)
+        user = User(
+            emp_id=f'E{number:04d}', email=f'user{number}@example.com', role=role,
+            department_id=department.id if department else None
+        )
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(EmployeeProfile(user_id=user.id, full_name=full_name or f'Employee {number}'))
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def auth(app):
+    """Authorization headers for a user, with the role claim /api/login issues"""
+    from flask_jwt_extended import create_access_token
+
+    def headers(user):
+        token = create_access_token(identity=str(user.id), additional_claims={'role': user.role})
+        return {'Authorization': f'Bearer {token}'}
+    return headers
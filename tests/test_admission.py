@@ -0,0 +1,145 @@
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+
+from admission import admission
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """The test app with admission control on: two heavy slots, at most one per endpoint, and
+    quotas generous enough to stay out of the way unless a test lowers them"""
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    monkeypatch.setenv('AUTO_CREATE_SCHEMA', '1')
+    monkeypatch.setenv('ADMISSION_ENABLED', '1')
+    monkeypatch.setenv('ADMISSION_HEAVY_CONCURRENCY', '2')
+    monkeypatch.setenv('ADMISSION_HEAVY_ENDPOINT_CONCURRENCY', '1')
+    monkeypatch.setenv('AUDIT_ENABLED', '0')
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    admission._buckets.clear()
+    admission.counters.clear()
+    monkeypatch.setattr(admission, 'quotas', {role: (100, 1000) for role in admission.quotas})
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin')
+
+
+@pytest.fixture
+def employee(make_user):
+    return make_user()
+
+
+def quota(role, rate, burst):
+    admission.quotas[role] = (rate, burst)
+
+
+def test_quota_exhausted_is_a_429_with_retry_after(client, auth, employee):
+    quota('employee', 0.5, 2)
+    headers = auth(employee)
+    assert [client.get('/api/profile', headers=headers).status_code for _ in range(2)] == [200, 200]
+
+    response = client.get('/api/profile', headers=headers)
+    assert response.status_code == 429
+    assert response.json == {'error': 'Request quota exceeded'}
+    # One token short at half a token a second
+    assert response.headers['Retry-After'] == '2'
+    assert admission.counters['rejected_quota.employee'] == 1
+
+
+def test_heavy_endpoints_cost_more(client, auth, admin):
+    quota('admin', 1, 15)
+    headers = auth(admin)
+    assert client.get('/api/admin/employees', headers=headers).status_code == 200
+    # Five tokens left: enough for ordinary calls, not for another scan
+    response = client.get('/api/admin/employees', headers=headers)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '5'
+    assert client.get('/api/admin/departments', headers=headers).status_code == 200
+
+
+def test_login_has_its_own_per_address_quota(client, employee):
+    quota('login', 1, 3)
+    quota('anonymous', 1, 1)
+    credentials = {'email': employee.email, 'password': 'wrong'}
+    statuses = [client.post('/api/login', json=credentials).status_code for _ in range(4)]
+    assert statuses == [401, 401, 401, 429]
+    # Other anonymous calls from the address draw on the anonymous quota, untouched so far
+    assert client.get('/api/profile').status_code == 401
+
+
+def test_token_without_a_role_claim_is_metered_by_the_users_role(client, admin):
+    quota('admin', 1, 3)
+    quota('employee', 1, 1)
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+    assert [client.get('/api/admin/departments', headers=headers).status_code for _ in range(4)] == [
+        200, 200, 200, 429
+    ]
+    assert admission.counters['rejected_quota.admin'] == 1
+
+
+def test_token_of_a_deleted_user_is_metered_as_anonymous(client):
+    quota('anonymous', 1, 1)
+    headers = {'Authorization': f'Bearer {create_access_token(identity="999")}'}
+    assert client.post('/api/events/token', headers=headers).status_code == 404
+    assert client.post('/api/events/token', headers=headers).status_code == 429
+    assert admission.counters['rejected_quota.anonymous'] == 1
+
+
+def test_refresh_takes_the_role_from_the_user(client, admin):
+    refresh = create_refresh_token(identity=str(admin.id))
+    response = client.post('/api/refresh', headers={'Authorization': f'Bearer {refresh}'})
+    assert response.status_code == 200
+    assert decode_token(response.json['access_token'])['role'] == 'admin'
+
+
+def open_stream(client, headers, path='/api/admin/employees'):
+    response = client.get(path, headers={**headers, 'Accept': 'application/x-ndjson'}, buffered=False)
+    assert response.status_code == 200
+    return response
+
+
+def test_full_lane_is_a_503_until_the_stream_closes(client, auth, admin):
+    headers = auth(admin)
+    first = open_stream(client, headers)
+    second = open_stream(client, headers, '/api/admin/leave-requests')
+    assert admission.lanes['heavy'].in_flight == 2
+
+    response = client.get('/api/admin/attendance', headers=headers)
+    assert response.status_code == 503
+    assert response.json == {'error': 'Server busy, try again shortly'}
+    assert response.headers['Retry-After'] == '1'
+    # Other lanes are unaffected
+    assert client.get('/api/admin/departments', headers=headers).status_code == 200
+
+    # The slot is held while the body is streamed and given back when it closes
+    b''.join(first.response)
+    first.close()
+    second.close()
+    assert admission.lanes['heavy'].in_flight == 0
+    assert client.get('/api/admin/attendance', headers=headers).status_code == 200
+    assert admission.counters['rejected_busy.heavy'] == 1
+
+
+def test_one_endpoint_cannot_take_the_whole_heavy_lane(client, auth, admin):
+    headers = auth(admin)
+    stream = open_stream(client, headers)
+    assert client.get('/api/admin/employees', headers=headers).status_code == 503
+    response = client.get('/api/admin/leave-requests', headers=headers)
+    assert response.status_code == 200
+    response.close()
+    stream.close()
+    assert admission.stats()['lanes']['heavy']['by_endpoint'] == {}
+
+
+def test_buffered_responses_release_their_slot(client, auth, admin):
+    headers = auth(admin)
+    for _ in range(3):
+        response = client.get('/api/admin/employees', headers=headers)
+        assert response.status_code == 200
+        response.close()
+    assert admission.lanes['heavy'].in_flight == 0
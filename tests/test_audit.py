@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+import audit
+from audit import AuditWriter, REDACTED
+from models import db
+
+
+@pytest.fixture
+def staff(make_user):
+    """An admin and an employee, created before auditing starts"""
+    return make_user('admin'), make_user()
+
+
+@pytest.fixture
+def writer(app, staff, monkeypatch, tmp_path):
+    """A fresh audit writer spooling to a temporary directory. No background thread:
+    tests flush by hand."""
+    writer = AuditWriter()
+    writer.enabled = True
+    writer.engine = db.engine
+    writer.spool_dir = str(tmp_path)
+    monkeypatch.setattr(audit, 'audit_log', writer)
+    return writer
+
+
+def entries(**filters):
+    db.session.commit()
+    return audit.query_audit_log(**filters)
+
+
+def test_update_through_the_api_records_the_diff_and_actor(client, auth, staff, writer):
+    admin, employee = staff
+    response = client.put(f'/api/admin/employees/{employee.emp_id}', headers=auth(admin),
+                          json={'role': 'manager', 'full_name': 'Grace Hopper'})
+    assert response.status_code == 200
+    assert writer.flush() == 2
+
+    by_entity = {entry['entity']: entry for entry in entries()}
+    assert by_entity['user']['action'] == 'update'
+    assert by_entity['user']['entity_id'] == employee.id
+    assert by_entity['user']['changes'] == {'role': ['employee', 'manager']}
+    assert by_entity['user']['actor_id'] == admin.id
+    assert by_entity['user']['actor_emp_id'] == admin.emp_id
+    assert by_entity['user']['endpoint'] == 'admin.update_employee'
+    assert by_entity['employee_profile']['changes']['full_name'] == ['Employee 2', 'Grace Hopper']
+
+
+def test_passwords_are_redacted(client, auth, staff, writer):
+    admin, employee = staff
+    response = client.put(f'/api/admin/employees/{employee.emp_id}', headers=auth(admin), json={'password': 'secret'})
+    assert response.status_code == 200
+    with open(writer._spool_path) as spool_file:
+        assert json.loads(spool_file.read())['changes'] == json.dumps({'password_hash': [REDACTED, REDACTED]})
+    writer.flush()
+    assert [entry['changes'] for entry in entries(entity='user')] == [
+        {'password_hash': [REDACTED, REDACTED]}
+    ]
+
+
+def test_rollback_discards_the_diffs(staff, writer):
+    _, employee = staff
+    employee.role = 'manager'
+    db.session.flush()
+    assert db.session.info['audit_pending']
+    db.session.rollback()
+    assert 'audit_pending' not in db.session.info
+    assert writer.flush() == 0
+    assert not os.path.exists(writer._spool_path)
+
+
+def dead_pid():
+    child = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    return int(child.stdout)
+
+
+def spool(writer, name, entity_id):
+    entry = {'action': 'delete', 'entity': 'department', 'entity_id': entity_id, 'changes': '{}',
+             'created_at': str(datetime(2026, 3, 2, 9, 0)), 'actor_id': None, 'endpoint': None}
+    path = os.path.join(writer.spool_dir, name)
+    with open(path, 'w') as spool_file:
+        # A worker killed mid-write leaves a partial last line, which is skipped
+        spool_file.write(json.dumps(entry) + '\n' + '{"action": "del')
+    return path
+
+
+def test_replay_picks_up_spools_of_dead_workers(staff, writer):
+    _, employee = staff
+    employee.role = 'manager'
+    db.session.commit()
+    ours = writer._spool_path
+    pid = dead_pid()
+    dead = [spool(writer, f'audit-{pid}-0123456789ab.log', 1), spool(writer, f'audit-{pid}-0123456789ab.log.1', 2),
+            # Written before spool files carried a token
+            spool(writer, f'audit-{pid}.log', 3)]
+    # An earlier process that had this one's pid
+    reused = spool(writer, f'audit-{os.getpid()}-0123456789ab.log.1', 4)
+
+    assert writer.replay_spools() == 4
+    assert sorted(entry['entity_id'] for entry in entries(entity='department')) == [1, 2, 3, 4]
+    assert not any(os.path.exists(path) for path in dead + [reused])
+    # This process's own spool is left to flush
+    assert os.path.exists(ours)
+    assert writer.flush() == 1
+    assert not os.listdir(writer.spool_dir)
+
+
+def test_spools_of_live_workers_are_left_alone(writer):
+    path = spool(writer, f'audit-{os.getppid()}-0123456789ab.log', 1)
+    assert writer.replay_spools() == 0
+    assert os.path.exists(path)
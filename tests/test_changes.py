@@ -0,0 +1,152 @@
+from datetime import date
+
+import pytest
+import sqlalchemy as sa
+
+from migrations import upgrade_schema
+from models import db, LeaveRequest, User, EmployeeProfile, CHANGE_TRACKED_MODELS
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin')
+
+
+def feed(client, headers, since='0', limit=None):
+    query = f'/api/admin/changes?since={since}' + (f'&limit={limit}' if limit is not None else '')
+    response = client.get(query, headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_paging_follows_next_token_until_has_more_is_false(client, auth, admin, make_user):
+    for _ in range(4):
+        make_user()
+    headers = auth(admin)
+    # The admin and four employees, a user and a profile row each
+    total = 10
+
+    seen = []
+    since = '0'
+    while True:
+        page = feed(client, headers, since, limit=3)
+        assert len(page['changes']) <= 3
+        seen.extend(page['changes'])
+        since = page['next_token']
+        if not page['has_more']:
+            break
+    assert len(seen) == total
+    versions = [change['version'] for change in seen]
+    assert versions == sorted(set(versions))
+    assert {(change['entity'], change['id']) for change in seen} == (
+        {('user', user.id) for user in User.query} | {('employee_profile', p.id) for p in EmployeeProfile.query}
+    )
+
+    # Nothing new: the same token comes back with an empty page
+    page = feed(client, headers, since)
+    assert page == {'changes': [], 'next_token': since, 'has_more': False}
+
+
+def test_has_more_at_the_limit_boundary(client, auth, admin, make_user):
+    make_user()
+    headers = auth(admin)
+
+    # Two users with a profile each: four changes
+    exact = feed(client, headers, limit=4)
+    assert len(exact['changes']) == 4
+    assert exact['has_more'] is False
+
+    short = feed(client, headers, limit=3)
+    assert short['has_more'] is True
+    rest = feed(client, headers, short['next_token'], limit=3)
+    assert [change['version'] for change in rest['changes']] == [exact['changes'][3]['version']]
+    assert rest['has_more'] is False
+
+
+def test_update_moves_a_row_past_the_token(client, auth, admin, make_user):
+    user = make_user()
+    headers = auth(admin)
+    token = feed(client, headers)['next_token']
+
+    user.profile.phone = '555-0100'
+    db.session.commit()
+    page = feed(client, headers, token)
+    assert [(c['entity'], c['op'], c['data']['phone']) for c in page['changes']] == [
+        ('employee_profile', 'upsert', '555-0100')
+    ]
+
+
+def test_delete_leaves_a_tombstone(client, auth, admin, make_user):
+    user = make_user()
+    leave = LeaveRequest(employee_id=user.id, start_date=date(2026, 3, 9), end_date=date(2026, 3, 10))
+    db.session.add(leave)
+    db.session.commit()
+    leave_id = leave.id
+    headers = auth(admin)
+    token = feed(client, headers)['next_token']
+
+    db.session.delete(leave)
+    db.session.commit()
+    page = feed(client, headers, token)
+    assert page['changes'] == [{
+        'version': page['changes'][0]['version'], 'entity': 'leave_request', 'op': 'delete', 'id': leave_id, 'data': None
+    }]
+    assert page['changes'][0]['version'] > int(token)
+
+
+@pytest.mark.parametrize('since', ['abc', '-1', '1.x', '1.-2', ''])
+def test_malformed_token_is_rejected(client, auth, admin, since):
+    response = client.get(f'/api/admin/changes?since={since}', headers=auth(admin))
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid since token'}
+
+
+def test_limit_below_one_is_a_limit_error(client, auth, admin):
+    response = client.get('/api/admin/changes?since=0&limit=0', headers=auth(admin))
+    assert response.status_code == 400
+    assert response.json == {'error': 'limit must be at least 1'}
+
+
+def test_upgrade_schema_backfills_an_old_table(app, tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    old_tables = {'user', 'department'}
+    db.metadata.create_all(engine, tables=[t for t in db.metadata.sorted_tables if t.name not in old_tables])
+    with engine.begin() as connection:
+        # user and department as they were before change tracking and calendars
+        connection.execute(sa.text(
+            "CREATE TABLE department (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE)"
+        ))
+        connection.execute(sa.text(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, emp_id VARCHAR(20) NOT NULL UNIQUE, '
+            'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(256) NOT NULL, role VARCHAR(20) NOT NULL, '
+            'department_id INTEGER REFERENCES department (id), manager_id INTEGER REFERENCES "user" (id))'
+        ))
+        connection.execute(sa.text("INSERT INTO department (name) VALUES ('Engineering')"))
+        for number in range(3):
+            connection.execute(sa.text(
+                "INSERT INTO \"user\" (emp_id, email, password_hash, role) VALUES (:emp_id, :email, 'x', 'employee')"
+            ), {'emp_id': f'OLD{number}', 'email': f'old{number}@example.com'})
+
+    with engine.begin() as connection:
+        added = upgrade_schema(connection)
+    assert {'user.updated_at', 'user.change_version', 'user.change_xid', 'department.calendar'} <= set(added)
+
+    with engine.connect() as connection:
+        rows = connection.execute(sa.text('SELECT change_xid, change_version FROM "user" ORDER BY id')).all()
+        assert [xid for xid, _ in rows] == [0, 0, 0]
+        assert [version for _, version in rows] == [1, 2, 3]
+        assert connection.execute(sa.text("SELECT calendar FROM department")).scalar() == 'default'
+        indexes = {index['name'] for index in sa.inspect(connection).get_indexes('user')}
+        assert 'ix_user_change_feed' in indexes
+
+    # Safe to re-run: nothing left to add or backfill
+    with engine.begin() as connection:
+        assert upgrade_schema(connection) == []
+    with engine.connect() as connection:
+        assert connection.execute(sa.text('SELECT max(change_version) FROM "user"')).scalar() == 3
+    engine.dispose()
+
+
+def test_every_change_tracked_model_is_in_the_feed():
+    from changes import FEED_MODELS
+    assert {model for model, _ in FEED_MODELS.values()} == set(CHANGE_TRACKED_MODELS)
@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Attendance, Department, LeaveRequest, ANNUAL_LEAVE_DAYS
+
+
+@pytest.fixture
+def employee(make_user):
+    engineering = Department(name='Engineering')
+    db.session.add(engineering)
+    db.session.commit()
+    user = make_user(department=engineering, full_name='Ada Lovelace')
+    today = datetime.utcnow().date()
+    # Approved leave on three weekdays of the current year, plus older requests
+    monday = date(today.year, 1, 5) + timedelta(days=-date(today.year, 1, 5).weekday() % 7)
+    db.session.add(LeaveRequest(employee_id=user.id, start_date=monday, end_date=monday + timedelta(days=2),
+                                reason='trip', status='approved'))
+    for number in range(12):
+        db.session.add(LeaveRequest(employee_id=user.id, start_date=date(2020, 1, 1) + timedelta(days=number),
+                                    end_date=date(2020, 1, 1) + timedelta(days=number), reason=f'old {number}',
+                                    created_at=datetime(2020, 1, 1) + timedelta(days=number)))
+    # Attendance today and on each of the 400 days before
+    db.session.add_all(
+        Attendance(user_id=user.id, date=today - timedelta(days=back), status='present') for back in range(401)
+    )
+    db.session.commit()
+    return user
+
+
+def dashboard(client, headers, query=''):
+    response = client.get(f'/api/me/dashboard{query}', headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_everything_by_default(client, auth, employee):
+    body = dashboard(client, auth(employee))
+    assert set(body) == {'employee', 'department', 'profile', 'leave_balance', 'leave_requests', 'attendance'}
+    assert body['employee']['emp_id'] == employee.emp_id
+    assert body['department'] == 'Engineering'
+    assert body['profile']['full_name'] == 'Ada Lovelace'
+    assert body['leave_balance'] == ANNUAL_LEAVE_DAYS - 3
+    # Newest first, ten by default
+    assert len(body['leave_requests']) == 10
+    assert body['leave_requests'][0]['reason'] == 'trip'
+    # Thirty days by default, today included
+    dates = [record['date'] for record in body['attendance']]
+    assert len(dates) == 30
+    assert dates[0] == datetime.utcnow().date().isoformat()
+
+
+def test_include_selects_sections(client, auth, employee):
+    body = dashboard(client, auth(employee), '?include=leave_balance,attendance')
+    assert set(body) == {'employee', 'leave_balance', 'attendance'}
+
+    body = dashboard(client, auth(employee), '?include=profile')
+    assert set(body) == {'employee', 'department', 'profile'}
+
+
+def test_unknown_section_is_rejected(client, auth, employee):
+    response = client.get('/api/me/dashboard?include=profile,salary,bonus', headers=auth(employee))
+    assert response.status_code == 400
+    assert response.json == {'error': 'Unknown dashboard section: bonus, salary'}
+
+
+@pytest.mark.parametrize('query, days, leaves', [
+    ('?days=7&leave_limit=3', 7, 3),
+    ('?days=0&leave_limit=0', 1, 1),
+    ('?days=-5&leave_limit=-1', 1, 1),
+    ('?days=1000&leave_limit=1000', 366, 13),
+    ('?days=abc&leave_limit=abc', 30, 10),
+])
+def test_days_and_leave_limit_are_clamped(client, auth, employee, query, days, leaves):
+    body = dashboard(client, auth(employee), query)
+    assert len(body['attendance']) == days
+    assert len(body['leave_requests']) == leaves
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.parametrize('include, most', [
+    ('', 4),
+    ('?include=profile', 1),
+    ('?include=attendance', 2),
+])
+def test_query_count(client, auth, employee, include, most):
+    headers = auth(employee)
+    with count_queries() as statements:
+        dashboard(client, headers, include)
+    assert len(statements) <= most, statements
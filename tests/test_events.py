@@ -0,0 +1,125 @@
+import queue
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import events
+from events import EventBroker, broker
+
+
+def drain(subscription):
+    messages = []
+    while True:
+        try:
+            messages.append(subscription.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+def test_messages_reach_only_subscribed_channels():
+    local = EventBroker()
+    employee = local.subscribe(['user:1', 'role:employee'])
+    admin = local.subscribe(['user:2', 'role:admin'])
+
+    local.publish(['role:admin'], 'leave_pending', {'id': 7})
+    local.publish(['user:1'], 'leave_status', {'id': 8})
+    # Subscribed through both channels, but delivered once
+    local.publish(['user:1', 'role:employee'], 'attendance', {'id': 9})
+
+    assert [m['data']['id'] for m in drain(employee)] == [8, 9]
+    assert [m['data']['id'] for m in drain(admin)] == [7]
+
+
+def test_unsubscribe_stops_delivery():
+    local = EventBroker()
+    subscription = local.subscribe(['user:1'])
+    local.unsubscribe(subscription, ['user:1'])
+    local.publish(['user:1'], 'leave_status', {'id': 1})
+    assert drain(subscription) == []
+    assert not local._subscribers
+
+
+def wait_for(subscription, count, timeout=5):
+    messages = []
+    deadline = time.monotonic() + timeout
+    while len(messages) < count and time.monotonic() < deadline:
+        try:
+            messages.append(subscription.get(timeout=0.1))
+        except queue.Empty:
+            pass
+    return messages
+
+
+def test_spool_fans_out_to_every_worker_across_rotations(tmp_path):
+    config = {'EVENT_BROKER_PATH': str(tmp_path / 'events.log'), 'EVENT_BROKER_MAX_BYTES': 400}
+    workers = [EventBroker(), EventBroker()]
+    for worker in workers:
+        worker.init_app(SimpleNamespace(config=config))
+    subscriptions = [worker.subscribe(['role:admin']) for worker in workers]
+    time.sleep(0.2)
+
+    for number in range(40):
+        workers[number % 2].publish(['role:admin'], 'leave_pending', {'id': number})
+
+    for subscription in subscriptions:
+        assert [m['data']['id'] for m in wait_for(subscription, 40)] == list(range(40))
+    assert len(list(tmp_path.glob('events.log.*'))) > 1
+
+
+@pytest.fixture
+def employee(make_user):
+    return make_user('employee')
+
+
+def open_stream(client, query):
+    response = client.get(f'/api/events?{query}', buffered=False)
+    return response, iter(response.response)
+
+
+def test_stream_token_opens_the_stream_and_filters_by_channel(client, auth, employee):
+    response = client.post('/api/events/token', headers=auth(employee))
+    assert response.status_code == 200
+    assert response.json['expires_in'] == events.STREAM_TOKEN_MAX_AGE
+
+    stream, body = open_stream(client, f"stream_token={response.json['stream_token']}")
+    assert stream.status_code == 200
+    assert stream.mimetype == 'text/event-stream'
+    assert next(body) == b'retry: 5000\n\n'
+
+    broker.publish(['role:admin'], 'leave_pending', {'id': 1})
+    broker.publish([f'user:{employee.id}'], 'leave_status', {'id': 2, 'status': 'approved'})
+    broker.publish(['role:employee'], 'announcement', {'id': 3})
+    assert next(body) == b'event: leave_status\ndata: {"id": 2, "status": "approved"}\n\n'
+    assert next(body) == b'event: announcement\ndata: {"id": 3}\n\n'
+
+    stream.close()
+    assert f'user:{employee.id}' not in broker._subscribers
+
+
+def test_bearer_header_still_opens_the_stream(client, auth, employee):
+    response = client.get('/api/events', headers=auth(employee), buffered=False)
+    assert response.status_code == 200
+    response.close()
+
+
+def test_access_token_is_not_accepted_in_the_url(client, auth, employee):
+    access_token = auth(employee)['Authorization'].split()[1]
+    response = client.get(f'/api/events?jwt={access_token}')
+    assert response.status_code == 401
+
+
+def test_forged_or_expired_stream_token_is_rejected(client, auth, employee, monkeypatch):
+    token = client.post('/api/events/token', headers=auth(employee)).json['stream_token']
+    assert client.get(f'/api/events?stream_token={token}x').status_code == 401
+
+    monkeypatch.setattr(events, 'STREAM_TOKEN_MAX_AGE', -1)
+    response = client.get(f'/api/events?stream_token={token}')
+    assert response.status_code == 401
+    assert response.json == {'error': 'Invalid or expired stream token'}
+
+
+def test_stream_token_is_not_an_access_token(client, auth, employee):
+    token = client.post('/api/events/token', headers=auth(employee)).json['stream_token']
+    response = client.get('/api/profile', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code in (401, 422)
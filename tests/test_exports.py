@@ -0,0 +1,134 @@
+from datetime import date, time
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import exports
+from models import db, Department, Attendance, LeaveRequest, ANNUAL_LEAVE_DAYS, leave_balances_for
+
+
+@pytest.fixture
+def staff(make_user):
+    engineering = Department(name='Engineering')
+    sales = Department(name='Sales')
+    db.session.add_all([engineering, sales])
+    db.session.commit()
+    admin = make_user('admin', engineering)
+    engineer = make_user('employee', engineering, full_name='Ada Engineer')
+    seller = make_user('employee', sales, full_name='Sam Seller')
+    db.session.add_all([
+        Attendance(user_id=engineer.id, date=date(2026, 3, 2), status='present',
+                   check_in_time=time(9, 0), check_out_time=time(17, 30)),
+        Attendance(user_id=engineer.id, date=date(2026, 3, 3), status='absent'),
+        Attendance(user_id=seller.id, date=date(2026, 3, 2), status='present'),
+        Attendance(user_id=seller.id, date=date(2026, 4, 1), status='present'),
+        # Monday 9 to Friday 13 March 2026
+        LeaveRequest(employee_id=engineer.id, start_date=date(2026, 3, 9), end_date=date(2026, 3, 13),
+                     reason='holiday', status='approved'),
+        LeaveRequest(employee_id=seller.id, start_date=date(2026, 5, 4), end_date=date(2026, 5, 5),
+                     reason='move', status='pending_manager'),
+    ])
+    db.session.commit()
+    return {'admin': admin, 'engineer': engineer, 'seller': seller, 'engineering': engineering}
+
+
+def read_arrow(data):
+    return pa.ipc.open_stream(BytesIO(data)).read_all()
+
+
+def read_parquet(data):
+    return pq.read_table(BytesIO(data))
+
+
+def test_attendance_arrow_round_trip(client, auth, staff):
+    response = client.get('/api/admin/export/attendance.arrow', headers=auth(staff['admin']))
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.apache.arrow.stream'
+
+    table = read_arrow(response.data)
+    assert table.schema == exports.attendance_schema()
+    rows = table.to_pylist()
+    assert len(rows) == 4
+    assert isinstance(rows[0].pop('attendance_id'), int)
+    assert rows[0] == {
+        'user_id': staff['engineer'].id, 'emp_id': staff['engineer'].emp_id,
+        'department': 'Engineering', 'date': date(2026, 3, 2), 'status': 'present',
+        'check_in_time': time(9, 0), 'check_out_time': time(17, 30),
+    }
+    assert rows[1]['check_in_time'] is None
+
+
+def test_leave_parquet_round_trip(client, auth, staff):
+    response = client.get('/api/admin/export/leave.parquet', headers=auth(staff['admin']))
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.apache.parquet'
+
+    table = read_parquet(response.data)
+    assert table.schema.remove_metadata() == exports.leave_schema()
+    rows = {row['emp_id']: row for row in table.to_pylist()}
+    assert rows[staff['engineer'].emp_id]['full_name'] == 'Ada Engineer'
+    assert rows[staff['engineer'].emp_id]['working_days'] == 5
+    assert rows[staff['seller'].emp_id]['status'] == 'pending_manager'
+
+
+def test_filters_by_date_range_and_department(client, auth, staff):
+    headers = auth(staff['admin'])
+    response = client.get('/api/admin/export/attendance.parquet?start_date=2026-03-01&end_date=2026-03-31',
+                          headers=headers)
+    assert sorted(str(day) for day in read_parquet(response.data).column('date').to_pylist()) == [
+        '2026-03-02', '2026-03-02', '2026-03-03'
+    ]
+
+    response = client.get(f"/api/admin/export/attendance.arrow?department_id={staff['engineering'].id}",
+                          headers=headers)
+    assert set(read_arrow(response.data).column('department').to_pylist()) == {'Engineering'}
+
+    # Leaves overlapping the range, not only those starting in it
+    response = client.get('/api/admin/export/leave.arrow?start_date=2026-03-12&end_date=2026-03-20', headers=headers)
+    assert read_arrow(response.data).column('emp_id').to_pylist() == [staff['engineer'].emp_id]
+
+
+def test_empty_export_is_a_valid_file(client, auth, staff):
+    response = client.get('/api/admin/export/attendance.arrow?start_date=2030-01-01', headers=auth(staff['admin']))
+    table = read_arrow(response.data)
+    assert table.num_rows == 0
+    assert table.schema == exports.attendance_schema()
+
+
+def test_stream_table_yields_one_batch_per_chunk(staff):
+    stmt = exports.attendance_query()
+    batches = list(exports.iter_record_batches(stmt, exports.attendance_schema(), chunk_size=1))
+    assert [batch.num_rows for batch in batches] == [1, 1, 1, 1]
+
+    data = b''.join(exports.stream_table(stmt, exports.attendance_schema(), 'arrow'))
+    assert read_arrow(data).num_rows == 4
+
+
+@pytest.mark.parametrize('query, message', [
+    ('start_date=03/01/2026', 'Invalid date format. Use YYYY-MM-DD'),
+    ('department_id=sales', 'Invalid department_id'),
+])
+def test_malformed_filters_are_rejected(client, auth, staff, query, message):
+    response = client.get(f'/api/admin/export/attendance.parquet?{query}', headers=auth(staff['admin']))
+    assert response.status_code == 400
+    assert response.json == {'error': message}
+
+
+def test_non_admin_cannot_export(client, auth, staff):
+    response = client.get('/api/admin/export/leave.parquet', headers=auth(staff['engineer']))
+    assert response.status_code == 403
+
+
+def test_leave_outside_the_calendar_counts_weekdays_like_balances(client, auth, staff):
+    engineer = staff['engineer']
+    # Monday 2 to Friday 13 January 2040, years past the precomputed calendar
+    db.session.add(LeaveRequest(employee_id=engineer.id, start_date=date(2040, 1, 2), end_date=date(2040, 1, 13),
+                                reason='sabbatical', status='approved'))
+    db.session.commit()
+
+    response = client.get('/api/admin/export/leave.arrow?start_date=2040-01-01', headers=auth(staff['admin']))
+    rows = read_arrow(response.data).to_pylist()
+    assert [row['working_days'] for row in rows] == [10]
+    assert leave_balances_for([engineer.id], 2040)[engineer.id] == ANNUAL_LEAVE_DAYS - 10
@@ -0,0 +1,96 @@
+import gzip
+import json
+from datetime import date, time
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from models import db, Attendance, AttendanceArchive
+from partitions import add_months, archive_attendance, parse_date_range
+
+
+@pytest.mark.parametrize('month, count, expected', [
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), 12, date(2027, 3, 1)),
+    (date(2026, 3, 1), -14, date(2025, 1, 1)),
+    (date(2026, 3, 1), 0, date(2026, 3, 1)),
+    # Any day of the month gives the start of the target month
+    (date(2026, 1, 31), 1, date(2026, 2, 1)),
+])
+def test_add_months(month, count, expected):
+    assert add_months(month, count) == expected
+
+
+def test_parse_date_range():
+    assert parse_date_range(MultiDict()) == (None, None)
+    assert parse_date_range(MultiDict({'start_date': '2026-03-01'})) == (date(2026, 3, 1), None)
+    assert parse_date_range(MultiDict({'start_date': '2026-03-01', 'end_date': '2026-03-31'})) == (
+        date(2026, 3, 1), date(2026, 3, 31)
+    )
+
+
+@pytest.mark.parametrize('args', [
+    {'start_date': '03/01/2026'},
+    {'end_date': '2026-02-30'},
+    {'start_date': '2026-03-01', 'end_date': 'tomorrow'},
+])
+def test_parse_date_range_rejects_malformed_dates(args):
+    with pytest.raises(ValueError):
+        parse_date_range(MultiDict(args))
+
+
+def test_attendance_endpoint_reports_a_malformed_date(client, auth, make_user):
+    user = make_user()
+    response = client.get('/api/attendance?start_date=2026-13-01', headers=auth(user))
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid date format. Use YYYY-MM-DD'}
+
+
+@pytest.fixture
+def history(make_user):
+    user = make_user()
+    days = [date(2023, 1, 2), date(2023, 1, 3), date(2023, 3, 1), date(2024, 2, 29), date(2024, 3, 1)]
+    db.session.add_all(
+        Attendance(user_id=user.id, date=day, status='present', check_in_time=time(9, 0)) for day in days
+    )
+    db.session.commit()
+    return user
+
+
+def test_archive_moves_whole_old_months(history):
+    # Two years back from March 2026: everything before March 2024 goes
+    archived = archive_attendance(2, today=date(2026, 3, 15))
+    # February 2023 had no rows and leaves no archive
+    assert archived == [(date(2023, 1, 1), 2), (date(2023, 3, 1), 1), (date(2024, 2, 1), 1)]
+
+    remaining = [row.date for row in Attendance.query.order_by(Attendance.date)]
+    assert remaining == [date(2024, 3, 1)]
+
+    archives = AttendanceArchive.query.order_by(AttendanceArchive.month).all()
+    assert [(a.month, a.row_count) for a in archives] == [(month, count) for month, count in archived]
+    january = [json.loads(line) for line in gzip.decompress(archives[0].payload).decode().splitlines()]
+    assert [(row['user_id'], row['date'], row['status'], row['check_in_time']) for row in january] == [
+        (history.id, '2023-01-02', 'present', '09:00:00'),
+        (history.id, '2023-01-03', 'present', '09:00:00'),
+    ]
+
+
+def test_archive_is_idempotent(history):
+    archive_attendance(2, today=date(2026, 3, 15))
+    assert archive_attendance(2, today=date(2026, 3, 15)) == []
+    assert AttendanceArchive.query.count() == 3
+
+
+def test_nothing_to_archive(history):
+    assert archive_attendance(5, today=date(2026, 3, 15)) == []
+    assert Attendance.query.count() == 5
+    assert AttendanceArchive.query.count() == 0
+
+
+def test_archive_command(app, history):
+    result = app.test_cli_runner().invoke(args=['archive-attendance', '--keep-years', '3'])
+    assert result.exit_code == 0, result.output
+    # Keeping three years from today archives all of 2023 at least
+    assert 'Archived 2 rows for 2023-01' in result.output
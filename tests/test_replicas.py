@@ -0,0 +1,129 @@
+import shutil
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+from models import db
+from replicas import router, PIN_COOKIE, Replica
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """Primary and replica as two SQLite files. No app context is kept open, so each
+    request gets its own g and session as it would in production."""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setenv('AUTO_CREATE_SCHEMA', '1')
+    monkeypatch.setenv('ADMISSION_ENABLED', '0')
+    monkeypatch.setenv('AUDIT_ENABLED', '0')
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+    for replica in router.replicas:
+        replica.engine.dispose()
+    router.replicas = []
+    router._pinned.clear()
+
+
+@pytest.fixture
+def staff(app, make_user, auth, tmp_path):
+    """(user_id, headers) for two employees; the replica is a copy of the primary in which
+    every name reads 'On Replica'"""
+    with app.app_context():
+        users = [make_user(full_name='On Primary') for _ in range(2)]
+        staff = [(str(user.id), auth(user)) for user in users]
+    with app.app_context():
+        db.engine.dispose()
+    primary = sqlite3.connect(tmp_path / 'primary.db')
+    primary.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    primary.close()
+    shutil.copy(tmp_path / 'primary.db', tmp_path / 'replica.db')
+    replica = sqlite3.connect(tmp_path / 'replica.db')
+    replica.execute("UPDATE employee_profile SET full_name = 'On Replica'")
+    replica.commit()
+    replica.close()
+    router.replicas[0].engine.dispose()
+    return staff
+
+
+@pytest.fixture
+def employee(staff):
+    return staff[0]
+
+
+def profile_name(client, headers):
+    response = client.get('/api/profile', headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json['employee']['profile']['full_name']
+
+
+def update_phone(client, headers):
+    response = client.patch('/api/profile/contact', json={'phone': '555-0100'}, headers=headers)
+    assert response.status_code == 200, response.json
+    return response
+
+
+def test_reads_go_to_the_replica(client, employee):
+    _, headers = employee
+    assert profile_name(client, headers) == 'On Replica'
+
+
+def test_writer_reads_its_own_write_from_the_primary(client, employee):
+    user_id, headers = employee
+    update_phone(client, headers)
+    assert router.is_pinned(user_id)
+    assert profile_name(client, headers) == 'On Primary'
+
+
+def test_pin_cookie_carries_the_pin_to_another_worker(app, client, employee):
+    _, headers = employee
+    response = update_phone(client, headers)
+    assert PIN_COOKIE in response.headers['Set-Cookie']
+
+    # The next read lands on a worker that didn't take the write
+    router._pinned.clear()
+    assert profile_name(client, headers) == 'On Primary'
+    # No cookie, no pin there
+    assert profile_name(app.test_client(), headers) == 'On Replica'
+
+
+def test_pin_cookie_is_only_good_for_its_identity(client, staff):
+    (_, writer), (_, colleague) = staff
+    update_phone(client, writer)
+    router._pinned.clear()
+    # Same cookie jar, different caller: still served by the replica
+    assert profile_name(client, colleague) == 'On Replica'
+
+
+def test_forged_pin_cookie_is_ignored(client, employee):
+    user_id, headers = employee
+    client.set_cookie(PIN_COOKIE, f'{user_id}.forged.signature')
+    assert profile_name(client, headers) == 'On Replica'
+
+
+def test_pin_expires(client, employee, monkeypatch):
+    user_id, headers = employee
+    monkeypatch.setattr(router, 'sticky_seconds', 0)
+    update_phone(client, headers)
+    client.delete_cookie(PIN_COOKIE)
+    assert not router.is_pinned(user_id)
+    assert profile_name(client, headers) == 'On Replica'
+
+
+def test_falls_back_to_the_primary_without_a_healthy_replica(client, employee, monkeypatch, tmp_path):
+    _, headers = employee
+    unreachable = Replica(sa.create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"))
+    unreachable.check()
+    assert not unreachable.healthy
+    monkeypatch.setattr(router, 'replicas', [unreachable])
+    assert profile_name(client, headers) == 'On Primary'
+
+
+def test_falls_back_to_the_primary_when_replicas_lag(client, employee, monkeypatch):
+    _, headers = employee
+    # Keep the background check from resetting the lag
+    monkeypatch.setattr(router.replicas[0], 'check', lambda: None)
+    monkeypatch.setattr(router.replicas[0], 'lag', router.max_lag + 1)
+    assert profile_name(client, headers) == 'On Primary'
@@ -0,0 +1,134 @@
+import pytest
+
+from models import db, Department, EmployeeSearch
+from search import search_employees
+
+
+@pytest.fixture
+def admin(make_user):
+    return make_user('admin', full_name='Root Admin')
+
+
+def entry(user):
+    return db.session.get(EmployeeSearch, user.id)
+
+
+def names(rows):
+    return [row.full_name for row, _ in rows]
+
+
+def test_new_user_is_indexed_on_flush(make_user):
+    engineering = Department(name='Engineering')
+    db.session.add(engineering)
+    db.session.commit()
+    user = make_user(department=engineering, full_name='Grace Hopper')
+
+    indexed = entry(user)
+    assert (indexed.emp_id, indexed.email, indexed.full_name, indexed.department) == (
+        user.emp_id, user.email, 'Grace Hopper', 'Engineering'
+    )
+    assert indexed.document == f'grace hopper {user.emp_id.lower()} {user.email} engineering'
+
+
+def test_profile_and_department_changes_reach_the_index(make_user):
+    engineering = Department(name='Engineering')
+    db.session.add(engineering)
+    db.session.commit()
+    user = make_user(department=engineering, full_name='Grace Hopper')
+
+    user.profile.full_name = 'Grace Brewster Hopper'
+    db.session.commit()
+    assert entry(user).full_name == 'Grace Brewster Hopper'
+
+    # A department rename reindexes every member
+    engineering.name = 'Research'
+    db.session.commit()
+    assert entry(user).department == 'Research'
+    assert search_employees('research', 10, 0)[0][0].user_id == user.id
+
+
+def test_deleted_user_leaves_the_index(make_user):
+    user = make_user(full_name='Grace Hopper')
+    user_id = user.id
+    db.session.delete(user.profile)
+    db.session.delete(user)
+    db.session.commit()
+    assert db.session.get(EmployeeSearch, user_id) is None
+    assert search_employees('grace', 10, 0) == []
+
+
+def test_uncommitted_change_is_rolled_back_from_the_index(make_user):
+    user = make_user(full_name='Grace Hopper')
+    user.profile.full_name = 'Someone Else'
+    db.session.flush()
+    assert entry(user).full_name == 'Someone Else'
+    db.session.rollback()
+    assert entry(user).full_name == 'Grace Hopper'
+
+
+@pytest.fixture
+def annabels(make_user):
+    # Inserted worst match first, so ranking rather than user_id decides the order
+    make_user(full_name='Joanna Smith')
+    make_user(full_name='Anabel Jones')
+    make_user(full_name='Annabel Lee')
+    make_user(full_name='Bob Stone')
+
+
+def test_prefix_matches_rank_before_substring_matches(annabels):
+    # Both contain the term and score 1; the name starting with it wins
+    assert names(search_employees('ann', 10, 0)) == ['Annabel Lee', 'Joanna Smith']
+
+
+def test_exact_matches_hide_fuzzy_ones(annabels):
+    assert names(search_employees('annabel', 10, 0)) == ['Annabel Lee']
+
+
+def test_fuzzy_matches_rank_by_shared_trigrams(annabels):
+    # No exact hit for the typo: rows sharing 4-character pieces, closest first
+    rows = search_employees('annabell', 10, 0)
+    assert names(rows) == ['Annabel Lee', 'Anabel Jones', 'Joanna Smith']
+    assert [round(score, 2) for _, score in rows] == [0.83, 0.5, 0.33]
+
+
+def test_typo_falls_back_to_single_trigrams(make_user):
+    make_user(full_name='Bob Stone')
+    make_user(full_name='Margaret Hamilton')
+    # No 4-character piece of "hamliton" appears anywhere; trigrams do
+    rows = search_employees('hamliton', 10, 0)
+    assert names(rows) == ['Margaret Hamilton', 'Bob Stone']
+    assert rows[0][1] > rows[1][1]
+
+
+def test_short_query_is_a_prefix_match(make_user):
+    sales = Department(name='Sales')
+    db.session.add(sales)
+    db.session.commit()
+    al = make_user(full_name='Al Jones')
+    make_user(full_name='Ruth Al')
+    seller = make_user(department=sales, full_name='Bob Stone')
+
+    # Case-insensitive prefix on the name; "Ruth Al" only contains it
+    assert [row.user_id for row, _ in search_employees('AL', 10, 0)] == [al.id]
+    # Department counts on the short path as well
+    assert [row.user_id for row, _ in search_employees('sa', 10, 0)] == [seller.id]
+    # LIKE wildcards in the query are literal
+    assert search_employees('%', 10, 0) == []
+
+
+def test_short_query_pages_by_emp_id(make_user):
+    users = [make_user(full_name=f'Al {number}') for number in range(5)]
+    first = search_employees('al', 2, 0)
+    second = search_employees('al', 2, 2)
+    assert [row.emp_id for row, _ in first + second] == sorted(user.emp_id for user in users)[:4]
+
+
+def test_search_endpoint(client, auth, admin, make_user):
+    make_user(full_name='Annabel Lee')
+    response = client.get('/api/admin/employees/search?q=annabel&per_page=1', headers=auth(admin))
+    assert response.status_code == 200
+    assert [result['full_name'] for result in response.json['results']] == ['Annabel Lee']
+    assert response.json['has_more'] is False
+
+    response = client.get('/api/admin/employees/search?q=%20', headers=auth(admin))
+    assert response.status_code == 400
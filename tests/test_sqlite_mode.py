@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+import sqlite_mode
+from sqlite_mode import SQLiteWriteQueue, WriteTimeout, run_write
+
+
+class Writer:
+    """A writer thread on its own SQLite file, with a table of unique numbers and a count of its commits"""
+
+    def __init__(self, path):
+        self.uri = f'sqlite:///{path}'
+        with sa.create_engine(self.uri).begin() as connection:
+            connection.execute(text('CREATE TABLE numbers (n INTEGER UNIQUE)'))
+        self.queue = SQLiteWriteQueue()
+        self.queue.start(self.uri)
+        self.commits = 0
+        event.listen(self.queue.engine, 'commit', self._count)
+
+    def _count(self, connection):
+        self.commits += 1
+
+    def numbers(self):
+        with sa.create_engine(self.uri).connect() as connection:
+            return sorted(connection.execute(text('SELECT n FROM numbers')).scalars())
+
+    def hold(self):
+        """Block the writer on a job until the returned event is set"""
+        started, release = threading.Event(), threading.Event()
+
+        def blocked(session):
+            started.set()
+            release.wait(5)
+
+        future = self.queue.submit(blocked)
+        assert started.wait(5)
+        return release, future
+
+
+def insert(number):
+    def job(session):
+        session.execute(text('INSERT INTO numbers VALUES (:n)'), {'n': number})
+        return number
+    return job
+
+
+@pytest.fixture
+def writer(tmp_path):
+    return Writer(tmp_path / 'writer.db')
+
+
+def test_queued_writes_commit_together(writer):
+    release, held = writer.hold()
+    futures = [writer.queue.submit(insert(number)) for number in range(3)]
+    release.set()
+    assert [future.result(5) for future in futures] == [0, 1, 2]
+    held.result(5)
+    # The held job writes nothing; the three queued behind it share one transaction
+    assert writer.commits == 1
+    assert writer.numbers() == [0, 1, 2]
+
+
+def test_batches_are_capped(writer, monkeypatch):
+    monkeypatch.setattr(sqlite_mode, 'WRITE_BATCH_SIZE', 2)
+    release, _ = writer.hold()
+    futures = [writer.queue.submit(insert(number)) for number in range(5)]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert writer.commits == 3
+
+
+def test_failed_batch_is_replayed_one_job_at_a_time(writer):
+    release, _ = writer.hold()
+    futures = [writer.queue.submit(insert(number)) for number in (1, 1, 2)]
+    release.set()
+    assert futures[0].result(5) == 1
+    with pytest.raises(IntegrityError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 2
+    assert writer.numbers() == [1, 2]
+    # The failed batch commits nothing; the replay commits the two good jobs one by one
+    assert writer.commits == 2
+
+
+@pytest.fixture
+def impatient(writer, monkeypatch):
+    monkeypatch.setattr(sqlite_mode, 'write_queue', writer.queue)
+    monkeypatch.setattr(sqlite_mode, 'WRITE_TIMEOUT', 0.05)
+    return writer
+
+
+def test_timed_out_write_that_has_not_started_is_withdrawn(impatient):
+    release, _ = impatient.hold()
+    with pytest.raises(WriteTimeout) as excinfo:
+        run_write(insert(1))
+    assert excinfo.value.applied is False
+    release.set()
+    impatient.queue.submit(insert(2)).result(5)
+    assert impatient.numbers() == [2]
+
+
+def test_timed_out_write_that_is_running_may_still_land(impatient):
+    release = threading.Event()
+
+    def slow(session):
+        release.wait(5)
+        return insert(1)(session)
+
+    with pytest.raises(WriteTimeout) as excinfo:
+        run_write(slow)
+    assert excinfo.value.applied is None
+    release.set()
+    impatient.queue.submit(insert(2)).result(5)
+    assert impatient.numbers() == [1, 2]
+
+
+def test_write_timeout_is_a_503(client, auth, make_user, monkeypatch):
+    def timing_out(fn, info=None):
+        raise WriteTimeout("Server busy, the change was not saved. Try again shortly", False)
+
+    monkeypatch.setattr(sqlite_mode, 'run_write', timing_out)
+    response = client.post('/api/attendance', json={'status': 'present'}, headers=auth(make_user()))
+    assert response.status_code == 503
+    assert response.json == {'error': 'Server busy, the change was not saved. Try again shortly'}
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,27 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK = os.path.join(ROOT, 'benchmarks', 'startup.py')
+
+
+def load_benchmark():
+    spec = importlib.util.spec_from_file_location('startup_benchmark', BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_lean_worker_skips_unused_subsystems():
+    assert load_benchmark().lean_subsystem_imports() == []
+
+
+def test_startup_overhead_within_budget():
+    # Absolute times swing too much on a shared test machine; the app's overhead over the frameworks doesn't
+    result = subprocess.run(
+        [sys.executable, BENCHMARK, '--runs', '5', '--relative'],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,87 @@
+import gzip
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import routes.admin
+import streaming
+from models import db, Attendance, LeaveRequest, ANNUAL_LEAVE_DAYS
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+
+@pytest.fixture
+def staff(make_user):
+    admin = make_user('admin')
+    employees = [make_user() for _ in range(4)]
+    # Balances count the current year: Monday to Wednesday of its second week of March
+    march = date(datetime.utcnow().year, 3, 8)
+    monday = march + timedelta(days=-march.weekday() % 7)
+    db.session.add_all([
+        LeaveRequest(employee_id=employees[0].id, start_date=monday, end_date=monday + timedelta(days=2),
+                     status='approved'),
+        Attendance(user_id=employees[1].id, date=date(2026, 3, 2), status='present'),
+    ])
+    db.session.commit()
+    return admin, employees
+
+
+def lines(data):
+    assert data.endswith(b'\n')
+    return [json.loads(line) for line in data.decode().splitlines()]
+
+
+def test_ndjson_has_one_object_per_line(client, auth, staff):
+    admin, employees = staff
+    response = client.get('/api/admin/employees', headers={**auth(admin), **NDJSON})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'Content-Encoding' not in response.headers
+    rows = lines(response.data)
+    assert [row['emp_id'] for row in rows] == [user.emp_id for user in [admin] + employees]
+
+    # Same rows as the JSON document
+    document = client.get('/api/admin/employees', headers=auth(admin)).json['employees']
+    assert rows == document
+
+
+def test_ndjson_is_gzipped_when_accepted(client, auth, staff):
+    admin, _ = staff
+    headers = {**auth(admin), **NDJSON, 'Accept-Encoding': 'gzip'}
+    response = client.get('/api/admin/leave-requests', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    rows = lines(gzip.decompress(response.data))
+    assert [(row['status'], row['leave_balance']) for row in rows] == [('approved', ANNUAL_LEAVE_DAYS - 3)]
+
+
+@pytest.mark.parametrize('path', ['/api/admin/employees', '/api/admin/leave-requests', '/api/admin/attendance'])
+def test_both_representations_vary_on_accept(client, auth, staff, path):
+    admin, _ = staff
+    json_response = client.get(path, headers=auth(admin))
+    assert json_response.mimetype == 'application/json'
+    assert 'Accept' in json_response.vary
+
+    ndjson_response = client.get(path, headers={**auth(admin), **NDJSON})
+    assert ndjson_response.mimetype == 'application/x-ndjson'
+    assert {'Accept', 'Accept-Encoding'} <= set(ndjson_response.vary)
+
+
+def test_balances_are_computed_once_per_chunk(client, auth, staff, monkeypatch):
+    admin, employees = staff
+    calls = []
+    leave_balances_for = routes.admin.leave_balances_for
+
+    def counting(user_ids, year):
+        calls.append(sorted(user_ids))
+        return leave_balances_for(user_ids, year)
+
+    monkeypatch.setattr(routes.admin, 'leave_balances_for', counting)
+    monkeypatch.setattr(routes.admin, 'ndjson_response',
+                        lambda stmt, serialize: streaming.ndjson_response(stmt, serialize, chunk_size=2))
+
+    rows = lines(client.get('/api/admin/employees', headers={**auth(admin), **NDJSON}).data)
+    user_ids = [user.id for user in [admin] + employees]
+    assert calls == [user_ids[0:2], user_ids[2:4], user_ids[4:5]]
+    balances = [row['leave_balance'] for row in rows]
+    assert balances == [ANNUAL_LEAVE_DAYS, ANNUAL_LEAVE_DAYS - 3] + [ANNUAL_LEAVE_DAYS] * 3
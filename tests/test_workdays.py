@@ -0,0 +1,83 @@
+from datetime import date
+
+from models import db, User, Department, LeaveRequest, Holiday, WorkingDay, leave_balances_for, ANNUAL_LEAVE_DAYS
+from workdays import rebuild_calendar, ensure_calendars, calendar_bounds
+
+
+def make_employee(calendar='default'):
+    department = Department(name=f'Dept {calendar}', calendar=calendar)
+    db.session.add(department)
+    db.session.flush()
+    user = User(emp_id=f'E-{calendar}', email=f'{calendar}@example.com', role='employee', department_id=department.id)
+    user.set_password('pw')
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def take_leave(user, start_date, end_date):
+    db.session.add(LeaveRequest(employee_id=user.id, start_date=start_date, end_date=end_date, reason='r', status='approved'))
+    db.session.commit()
+
+
+def days_taken(user, year):
+    return ANNUAL_LEAVE_DAYS - leave_balances_for([user.id], year)[user.id]
+
+
+def test_leave_over_a_weekend_counts_only_weekdays(app):
+    user = make_employee()
+    # Friday 6 March to Monday 9 March 2026
+    take_leave(user, date(2026, 3, 6), date(2026, 3, 9))
+    assert days_taken(user, 2026) == 2
+
+
+def test_leave_on_a_weekend_costs_nothing(app):
+    user = make_employee()
+    take_leave(user, date(2026, 3, 7), date(2026, 3, 8))
+    assert days_taken(user, 2026) == 0
+
+
+def test_holiday_is_not_a_working_day(app):
+    user = make_employee('regional')
+    db.session.add(Holiday(calendar='regional', date=date(2026, 3, 11), name='Regional holiday'))
+    rebuild_calendar('regional')
+    take_leave(user, date(2026, 3, 9), date(2026, 3, 13))
+    assert days_taken(user, 2026) == 4
+
+
+def test_leave_outside_the_calendar_falls_back_to_weekdays(app):
+    user = make_employee()
+    first_day, _ = calendar_bounds()
+    year = first_day.year - 1
+    assert WorkingDay.query.filter(WorkingDay.date < first_day).first() is None
+    # 1-14 March of a year before the calendar starts: two full weeks
+    take_leave(user, date(year, 3, 1), date(year, 3, 14))
+    assert days_taken(user, year) == 10
+
+
+def test_ensure_calendars_extends_a_short_calendar(app):
+    _, last_day = calendar_bounds()
+    db.session.execute(WorkingDay.__table__.delete().where(WorkingDay.date > date(last_day.year - 1, 12, 31)))
+    db.session.commit()
+    assert ensure_calendars() == ['default']
+    assert db.session.query(db.func.max(WorkingDay.date)).scalar() == last_day
+    assert ensure_calendars() == []
+
+
+def test_new_department_builds_its_calendar_even_with_holidays(app):
+    db.session.add(Holiday(calendar='branch', date=date(2026, 5, 1), name='Branch day'))
+    db.session.commit()
+    assert WorkingDay.query.filter_by(calendar='branch').first() is None
+
+    admin = User(emp_id='A1', email='admin@example.com', role='admin')
+    admin.set_password('pw')
+    db.session.add(admin)
+    db.session.commit()
+    from flask_jwt_extended import create_access_token
+    token = create_access_token(identity=str(admin.id))
+    response = app.test_client().post(
+        '/api/admin/departments', json={'name': 'Branch', 'calendar': 'branch'},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    assert response.status_code == 201
+    assert WorkingDay.query.filter_by(calendar='branch', date=date(2026, 5, 1)).one().is_working is False
@@ -0,0 +1,63 @@
+"""Working-day calendars.
+
+`working_day` holds one row per day for each calendar with a running count
+of working days (weekdays that aren't holidays). The number of working days
+in any interval is then the difference of two prefix sums; see
+`models.working_days_between`. Calendars are rebuilt whenever their holidays
+change, and extended by ``flask extend-calendars`` (run it daily from cron,
+like ``flask attendance-partitions``) and at startup as the years roll over.
+Leaves outside the calendar are still counted, as plain weekdays.
+"""
+from datetime import date, timedelta
+
+from models import db, Department, Holiday, WorkingDay, DEFAULT_CALENDAR
+
+CALENDAR_YEARS_BACK = 5
+CALENDAR_YEARS_AHEAD = 2
+
+
+def calendar_bounds(today=None):
+    year = (today or date.today()).year
+    return date(year - CALENDAR_YEARS_BACK, 1, 1), date(year + CALENDAR_YEARS_AHEAD, 12, 31)
+
+
+def rebuild_calendar(calendar, today=None):
+    """Recompute the prefix sums for one calendar; the caller commits"""
+    first_day, last_day = calendar_bounds(today)
+    holidays = {
+        holiday_date for (holiday_date,) in
+        db.session.query(Holiday.date).filter(Holiday.calendar == calendar)
+    }
+
+    rows = []
+    cumulative = 0
+    day = first_day
+    while day <= last_day:
+        is_working = day.weekday() < 5 and day not in holidays
+        cumulative += is_working
+        rows.append({"calendar": calendar, "date": day, "is_working": is_working, "cumulative": cumulative})
+        day += timedelta(days=1)
+
+    db.session.execute(WorkingDay.__table__.delete().where(WorkingDay.calendar == calendar))
+    db.session.execute(WorkingDay.__table__.insert(), rows)
+
+
+def ensure_calendars(today=None):
+    """Build calendars that are missing or no longer reach CALENDAR_YEARS_AHEAD; returns their names"""
+    _, last_day = calendar_bounds(today)
+    calendars = {DEFAULT_CALENDAR}
+    calendars.update(name for (name,) in db.session.query(Department.calendar).distinct())
+    calendars.update(name for (name,) in db.session.query(Holiday.calendar).distinct())
+
+    rebuilt = []
+    for calendar in sorted(calendars):
+        covered_until = (
+            db.session.query(db.func.max(WorkingDay.date))
+            .filter(WorkingDay.calendar == calendar)
+            .scalar()
+        )
+        if covered_until is None or covered_until < last_day:
+            rebuild_calendar(calendar, today)
+            rebuilt.append(calendar)
+    db.session.commit()
+    return rebuilt